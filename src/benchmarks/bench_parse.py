@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of the keyword extraction from CORDIS pages: the full BeautifulSoup parse
+against the streaming KeywordTagParser path. Runs on saved CORDIS pages: the fixture pages of
+fetch_pages.py (benchmarks/pages), the page cache of extract_keywords.py (out/cache) or any folder of .html files.
+
+usage: python benchmarks/bench_parse.py
+       python benchmarks/bench_parse.py --pages out/cache
+"""
+import argparse
+import sys
+import timeit
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "code"))
+from extract_keywords import KeywordExtractor
+from fetch_pages import PAGES_DIR
+
+
+def load_pages(pages_dir: Path, max_pages: int | None = None) -> list[str]:
+    pages = []
+    for path in sorted(pages_dir.rglob("*.html")):
+        pages.append(path.read_text(encoding="utf-8"))
+        if max_pages is not None and len(pages) >= max_pages:
+            break
+    return pages
+
+
+def bench_parse(pages: list[str], repeat: int = 5) -> dict:
+    """
+    Time both parse paths over all pages, returns the best time per page in seconds.
+    """
+    extractor = KeywordExtractor()
+    full = lambda: [extractor._find_keywords_content_full(page) for page in pages]
+    fast = lambda: [extractor._find_keywords_content_fast(page) for page in pages]
+
+    #both paths have to find the same content before timing them means anything
+    mismatches = sum(a != b for a, b in zip(full(), fast()))
+    if mismatches > 0:
+        warnings.warn(f"Fast path differs from the full parse on {mismatches} pages.", Warning)
+
+    results = {"pages": len(pages), "mismatches": mismatches}
+    for name, func in [("full", full), ("fast", fast)]:
+        results[name] = min(timeit.repeat(func, number=1, repeat=repeat)) / len(pages)
+    results["speedup"] = results["full"] / results["fast"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", "-p", default=PAGES_DIR, type=Path, help="folder with saved .html pages (default: the fixture pages, benchmarks/pages)")
+    parser.add_argument("--max-pages", "-n", default=None, type=int)
+    parser.add_argument("--repeat", "-r", default=5, type=int)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages, args.max_pages)
+    if len(pages) == 0:
+        parser.error(f"no .html pages found in {args.pages}, save some with benchmarks/fetch_pages.py")
+
+    results = bench_parse(pages, args.repeat)
+    print(f"{results['pages']} pages, {results['mismatches']} mismatches")
+    print(f"full parse: {results['full'] * 1e3:.3f} ms/page")
+    print(f"fast parse: {results['fast'] * 1e3:.3f} ms/page")
+    print(f"speedup:    {results['speedup']:.1f}x")
@@ -0,0 +1,147 @@
+"""
+Load test of the scraper of extract_keywords.py against the local CORDIS stand-in (cordis_stub_server.py):
+scrapes the same projects for every combination of --workers and --backoff and reports the throughput,
+the request latency (p50/p95/p99, including retries and backoff) and the retries, failed requests and
+pages without keywords, client side and as seen by the server. Results are written as JSON like run_benchmarks.py.
+
+usage: python benchmarks/bench_scraper.py --projects 2000 --workers 1 4 16 --backoff 0.1 0.5 --latency 0.1 --jitter 0.05 --rate-429 0.05
+       python benchmarks/bench_scraper.py --base-url http://127.0.0.1:8000/project/id/   # a stand-in that is already running
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "code"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+import requests
+from extract_keywords import KeywordExtractor
+from metrics import metrics, summarize
+from run_benchmarks import git_commit
+
+SERVER_SCRIPT = ROOT / "benchmarks" / "cordis_stub_server.py"
+SERVER_OPTIONS = ["pages", "latency", "jitter", "rate_429", "rate_5xx", "rate_missing", "retry_after", "page_size", "seed"]
+
+
+def start_server(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    # in its own process, so the server threads don't compete with the scraper for the GIL
+    command = [sys.executable, str(SERVER_SCRIPT), "--port", "0"]
+    for option in SERVER_OPTIONS:
+        value = getattr(args, option)
+        if value is not None:
+            command += [f"--{option.replace('_', '-')}", str(value)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if not line.startswith("Serving on "):
+        server.kill()
+        raise RuntimeError(f"Stub server did not start: {line}")
+    return server, line[len("Serving on "):].strip()
+
+
+def server_stats(base_url: str, reset: bool = False) -> dict:
+    stats_url = requests.compat.urljoin(base_url, "/stats") + ("?reset=1" if reset else "")
+    return requests.get(stats_url, timeout=10).json()
+
+
+def bench_scraper(base_url: str, project_ids: list[str], workers: int, backoff: float, retries: int, timeout: float) -> dict:
+    extractor = KeywordExtractor(workers=workers, base_url=base_url)
+    extractor.backoff = backoff
+    extractor.retries = retries
+    extractor.timeout = timeout
+    metrics.pop()
+    server_stats(base_url, reset=True)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # one warning per failed request or missing page
+        start = time.perf_counter()
+        results = extractor.scrape_keywords(project_ids, leave=False)
+        seconds = time.perf_counter() - start
+
+    collected = metrics.pop()
+    counters = collected["counters"]
+    return {
+        "workers": workers,
+        "backoff": backoff,
+        "projects": len(project_ids),
+        "seconds": seconds,
+        "projects_per_second": len(project_ids) / seconds,
+        "latency": summarize(collected["histograms"].get("http.latency_seconds", [])),
+        "retries": counters.get("http.retries", 0),
+        "retried_statuses": {name.rsplit(".", 1)[-1]: n for name, n in counters.items() if name.startswith("http.retried_status.")},
+        "retries_exhausted": counters.get("http.retries_exhausted", 0),
+        "errors": sum(result == "ERROR" for result in results),
+        "not_found": sum(result == "NOT FOUND" for result in results),
+        "server_responses": server_stats(base_url),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default=None, type=str, help="url of a running stand-in (default: start one with the options below)")
+    parser.add_argument("--projects", "-n", default=1_000, type=int)
+    parser.add_argument("--workers", "-w", nargs="+", default=[1, 4, 16], type=int)
+    parser.add_argument("--backoff", "-b", nargs="+", default=[0.1], type=float)
+    parser.add_argument("--retries", default=3, type=int)
+    parser.add_argument("--timeout", default=10, type=float)
+    parser.add_argument("--out", "-o", default=None, type=Path, help="results file (default: benchmarks/results/<date>-<commit>-scraper.json)")
+    server_options = parser.add_argument_group("stand-in options, see cordis_stub_server.py")
+    server_options.add_argument("--pages", default=None, type=Path)
+    server_options.add_argument("--latency", "-l", default=0.05, type=float)
+    server_options.add_argument("--jitter", "-j", default=0.02, type=float)
+    server_options.add_argument("--rate-429", default=0.02, type=float)
+    server_options.add_argument("--rate-5xx", default=0.01, type=float)
+    server_options.add_argument("--rate-missing", default=0.01, type=float)
+    server_options.add_argument("--retry-after", default=None, type=int)
+    server_options.add_argument("--page-size", default=None, type=int)
+    server_options.add_argument("--seed", "-s", default=None, type=int)
+    args = parser.parse_args()
+
+    server, base_url = (None, args.base_url) if args.base_url is not None else start_server(args)
+    project_ids = [str(project_id) for project_id in range(100_000, 100_000 + args.projects)]
+    results = []
+    try:
+        print(f"Scraping {args.projects} projects from {base_url}")
+        print(f"{'workers':>8} {'backoff':>8} {'proj/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'retries':>8} {'errors':>8}")
+        for workers in args.workers:
+            for backoff in args.backoff:
+                result = bench_scraper(base_url, project_ids, workers, backoff, args.retries, args.timeout)
+                results.append(result)
+                latency = result["latency"]
+                print(
+                    f"{workers:>8} {backoff:>8} {result['projects_per_second']:>8.1f} {latency.get('p50', 0) * 1e3:>8.1f} "
+                    f"{latency.get('p95', 0) * 1e3:>8.1f} {latency.get('p99', 0) * 1e3:>8.1f} {result['retries']:>8} {result['errors']:>8}"
+                )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.base_url is not None:
+        server_setup = {"base_url": base_url}
+    else:
+        server_setup = {option: getattr(args, option) for option in SERVER_OPTIONS}
+        server_setup["pages"] = str(args.pages) if args.pages is not None else None
+    commit = git_commit()
+    report = {
+        **commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": server_setup,
+        "retries": args.retries,
+        "results": results,
+    }
+
+    out_file = args.out
+    if out_file is None:
+        out_file = ROOT / "benchmarks" / "results" / f"{datetime.now():%Y%m%d-%H%M%S}-{commit['commit'][:8]}-scraper.json"
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_file, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Written to {out_file}")
@@ -0,0 +1,186 @@
+"""
+Local stand-in for the CORDIS project pages, to run the scraper of extract_keywords.py against without
+hitting CORDIS. Serves GET /project/id/<id> with recorded pages (a folder of <id>.html files, e.g. the
+pages of generate_data.py, or the page cache of extract_keywords.py) or synthetic ones, with:
+    --latency/--jitter   response time, latency + an exponential jitter (mean jitter), in seconds
+    --rate-429           fraction of requests answered with 429 Too Many Requests
+    --rate-5xx           fraction of requests answered with 500, 502, 503 or 504 (the status_forcelist)
+    --rate-missing       fraction of pages served without the keywords <meta> tag
+GET /stats returns the number of requests per status as JSON, /stats?reset=1 also resets them.
+
+usage: python benchmarks/cordis_stub_server.py --port 8000 --latency 0.2 --rate-429 0.05
+       python code/extract_keywords.py --base-url http://127.0.0.1:8000/project/id/
+"""
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "benchmarks"))
+from generate_data import WORDS, make_page
+
+PROJECT_PATH = "/project/id/"
+ERROR_STATUSES = [500, 502, 503, 504]
+KEYWORDS_TAG = re.compile(r"<meta\s+name=\"keywords\"[^>]*>\s*", re.IGNORECASE)
+
+
+def load_recorded_pages(pages_dir: Path) -> dict[str, str]:
+    """
+    {project id: page} of the .html files in pages_dir. Pages of the page cache are named by a hash,
+    their project id is in the .json next to them, other pages are named <id>.html.
+    """
+    pages = {}
+    for path in sorted(Path(pages_dir).rglob("*.html")):
+        project_id = path.stem
+        meta_path = path.with_suffix(".json")
+        if meta_path.exists():
+            with open(meta_path, "r") as f:
+                project_id = json.load(f).get("project_id", project_id)
+        pages[str(project_id)] = path.read_text(encoding="utf-8")
+    return pages
+
+
+class StubConfig:
+    def __init__(self,
+                 pages: dict[str, str] = {},
+                 latency: float = 0,
+                 jitter: float = 0,
+                 rate_429: float = 0,
+                 rate_5xx: float = 0,
+                 rate_missing: float = 0,
+                 retry_after: int | None = None,
+                 n_synthetic: int = 50,
+                 page_size: int = 150_000,
+                 seed: int = 0):
+        self.pages = pages              #recorded pages, other ids get one of the synthetic pages
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rate_missing = rate_missing
+        self.retry_after = retry_after  #Retry-After header of the 429s, None: not sent
+        self.rng = np.random.default_rng(seed)
+        self.rng_lock = threading.Lock()
+        self.stats = Counter()          #{status: number of responses}
+        self.stats_lock = threading.Lock()
+
+        #a fixed set of synthetic pages is enough, generating one per request would make the server the bottleneck
+        vocabulary = [" ".join(self.rng.choice(WORDS, self.rng.integers(1, 4))) for _ in range(500)]
+        self.synthetic_pages = [
+            make_page(self.rng, i, list(dict.fromkeys(self.rng.choice(vocabulary, self.rng.integers(3, 10)))), page_size)
+            for i in range(n_synthetic if len(pages) == 0 else 0)
+        ]
+
+    def draw(self) -> tuple[float, float]:
+        #(response time, uniform draw that decides the response), numpy generators are not thread safe
+        with self.rng_lock:
+            delay = self.latency + (self.rng.exponential(self.jitter) if self.jitter > 0 else 0)
+            return delay, self.rng.random()
+
+    def get_page(self, project_id: str) -> str:
+        page = self.pages.get(project_id)
+        if page is not None:
+            return page
+        pages = self.synthetic_pages if len(self.synthetic_pages) > 0 else list(self.pages.values())
+        #the same id always gets the same page
+        return pages[int(hashlib.sha1(project_id.encode("utf-8")).hexdigest(), 16) % len(pages)]
+
+    def missing_keywords(self, project_id: str) -> bool:
+        #fixed per id like on CORDIS, so a retry doesn't find them either
+        return int(hashlib.sha1(f"missing {project_id}".encode("utf-8")).hexdigest(), 16) % 10_000 < self.rate_missing * 10_000
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    config: StubConfig = None
+    protocol_version = "HTTP/1.1"  #keep-alive, like CORDIS, so the scraper's connection pool matters
+    disable_nagle_algorithm = True  #headers and body are written separately, don't wait for the ACK in between
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            with self.config.stats_lock:
+                stats = dict(self.config.stats)
+                if "reset" in parse_qs(url.query):
+                    self.config.stats.clear()
+            self._respond(200, json.dumps(stats), "application/json")
+            return
+        if not url.path.startswith(PROJECT_PATH):
+            self._respond(404, "Not Found")
+            return
+
+        project_id = url.path[len(PROJECT_PATH):].strip("/")
+        delay, draw = self.config.draw()
+        time.sleep(delay)
+        if draw < self.config.rate_429:
+            headers = {"Retry-After": str(self.config.retry_after)} if self.config.retry_after is not None else {}
+            self._respond(429, "Too Many Requests", headers=headers)
+        elif draw < self.config.rate_429 + self.config.rate_5xx:
+            status = ERROR_STATUSES[int((draw - self.config.rate_429) / self.config.rate_5xx * len(ERROR_STATUSES))]
+            self._respond(status, "Server Error")
+        else:
+            page = self.config.get_page(project_id)
+            if self.config.missing_keywords(project_id):
+                page = KEYWORDS_TAG.sub("", page)
+            self._respond(200, page)
+
+    def _respond(self, status: int, body: str, content_type: str = "text/html; charset=utf-8", headers: dict = {}):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        if self.path.startswith(PROJECT_PATH):
+            with self.config.stats_lock:
+                self.config.stats[status] += 1
+
+
+def make_server(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1", type=str)
+    parser.add_argument("--port", "-p", default=8000, type=int, help="0: any free port")
+    parser.add_argument("--pages", default=None, type=Path, help="folder with recorded pages (<id>.html or a page cache, default: synthetic pages)")
+    parser.add_argument("--latency", "-l", default=0.0, type=float, help="seconds per response")
+    parser.add_argument("--jitter", "-j", default=0.0, type=float, help="mean of the exponential jitter added to the latency, in seconds")
+    parser.add_argument("--rate-429", default=0.0, type=float)
+    parser.add_argument("--rate-5xx", default=0.0, type=float)
+    parser.add_argument("--rate-missing", default=0.0, type=float, help="fraction of projects whose page has no keywords")
+    parser.add_argument("--retry-after", default=None, type=int, help="Retry-After of the 429s in seconds (default: not sent)")
+    parser.add_argument("--page-size", default=150_000, type=int, help="approximate size of the synthetic pages in bytes")
+    parser.add_argument("--seed", "-s", default=0, type=int)
+    args = parser.parse_args()
+
+    pages = load_recorded_pages(args.pages) if args.pages is not None else {}
+    if args.pages is not None and len(pages) == 0:
+        parser.error(f"no .html pages found in {args.pages}")
+    config = StubConfig(pages, args.latency, args.jitter, args.rate_429, args.rate_5xx, args.rate_missing,
+                        args.retry_after, page_size=args.page_size, seed=args.seed)
+    server = make_server(config, args.host, args.port)
+    # the first line is read by bench_scraper.py to find the port
+    print(f"Serving on http://{args.host}:{server.server_port}{PROJECT_PATH}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,51 @@
+"""
+Saves CORDIS project pages as the fixture pages of bench_parse.py (benchmarks/pages/<id>.html): the pages of
+the given project ids, or of the first --number projects of a project file. Rerun it when CORDIS changes its
+markup, so the parse benchmark keeps running on the pages the scraper gets.
+
+usage: python benchmarks/fetch_pages.py --projectfile datasets/project.csv --number 20
+       python benchmarks/fetch_pages.py --ids <id> <id> ...
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "code"))
+from extract_keywords import KeywordExtractor
+
+PAGES_DIR = ROOT / "benchmarks" / "pages"
+
+
+def fetch_pages(project_ids: list[str], out_dir: Path = PAGES_DIR, rate_limit: float = 1) -> int:
+    """
+    Save the page of every project in project_ids to out_dir, returns the number of pages saved.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    extractor = KeywordExtractor(rate_limit=rate_limit)
+    saved = 0
+    for project_id in project_ids:
+        html_txt = extractor.scrape_url(project_id)
+        if html_txt == "ERROR":
+            continue
+        (out_dir / f"{project_id}.html").write_text(html_txt, encoding="utf-8")
+        saved += 1
+    return saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ids", nargs="+", default=None, type=str, help="project ids to fetch")
+    parser.add_argument("--projectfile", "-pf", default=ROOT / "datasets" / "project.csv", type=Path, help="fetch the first --number projects of this file if no --ids are given")
+    parser.add_argument("--number", "-n", default=20, type=int)
+    parser.add_argument("--out", "-o", default=PAGES_DIR, type=Path)
+    parser.add_argument("--rate-limit", "-rl", default=1, type=float, help="max requests per second to CORDIS")
+    args = parser.parse_args()
+
+    project_ids = args.ids
+    if project_ids is None:
+        project_ids = pd.read_csv(args.projectfile, usecols=["id"], nrows=args.number, dtype=str)["id"].tolist()
+    saved = fetch_pages(project_ids, args.out, args.rate_limit)
+    print(f"Saved {saved} of {len(project_ids)} pages to {args.out}")
@@ -0,0 +1,212 @@
+"""
+Generates a synthetic dataset with the layout of the CORDIS exports and the intermediate tables of the pipeline,
+at any scale, for the benchmarks:
+    project.csv, euroSciVoc.csv   as downloaded from the European Data portal
+    extracted.csv                 as written by extract_keywords.py
+    kw_categorizations.csv        as written by get_keyword_mappings.py, for the keywords in extracted.csv
+    pages/<id>.html               synthetic project pages with the keywords <meta> tag, laid out like the
+                                  CORDIS pages (make_page), not saved CORDIS markup
+
+Keywords are drawn from the category keywords of categorization/categories.json and generated
+multi-word keywords, with a Zipf-like frequency, so a few keywords are in many projects.
+
+usage: python benchmarks/generate_data.py --projects 100000 --out benchmarks/data/100k
+"""
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+CATEGORIZATION_DIR = ROOT / "categorization"
+sys.path.insert(0, str(ROOT / "code"))
+from extract_keywords import KeywordExtractorEU
+from normalize import normalize_keyword
+
+PROJECT_COLUMNS = [
+    "id", "acronym", "status", "title", "startDate", "endDate", "totalCost", "ecMaxContribution", "legalBasis", "topics",
+    "ecSignatureDate", "frameworkProgramme", "masterCall", "subCall", "fundingScheme", "nature", "objective",
+    "contentUpdateDate", "rcn", "grantDoi",
+]
+TOPIC_FORMATS = [
+    "HORIZON-CL{n}-{year}-D{d}-01-{i:02d}", "HORIZON-CL{n}-{year}-{d:02d}-{i:02d}", "HORIZON-MSCA-{year}-PF-01-{i:02d}",
+    "HORIZON-WIDERA-{year}-ACCESS-{i:02d}", "HORIZON-EIC-{year}-PATHFINDEROPEN-{i:02d}", "ERC-{year}-STG",
+    "ERC-{year}-COG", "ERC-{year}-ADG", "EURATOM-{year}-NRT-01-{i:02d}", "HORIZON-INFRA-{year}-DEV-01-{i:02d}",
+]
+WORDS = [
+    "adaptive", "advanced", "autonomous", "bio", "circular", "clean", "cognitive", "digital", "distributed", "green",
+    "hybrid", "integrated", "low-carbon", "marine", "molecular", "neural", "open", "quantum", "resilient", "smart",
+    "sustainable", "urban", "analysis", "batteries", "catalysis", "cells", "climate", "computing", "data", "design",
+    "detection", "devices", "ecosystems", "energy", "governance", "health", "imaging", "infrastructure", "learning",
+    "manufacturing", "materials", "mobility", "modelling", "networks", "policy", "robotics", "sensing", "storage",
+    "systems", "therapy", "transport", "water",
+]
+PAGE_FILLER = "<div class=\"c-article__text\"><p>{}</p></div>\n"
+
+
+def make_vocabulary(rng: np.random.Generator, n_keywords: int) -> list[str]:
+    # category keywords first (the most frequent ones), then generated ones
+    with open(CATEGORIZATION_DIR / "categories.json", "r") as f:
+        category_kws = [kw for kws in json.load(f).values() for kw in kws]
+    kws = list(dict.fromkeys(category_kws))
+    seen = set(kws)
+    generated_kws = []
+    while len(kws) + len(generated_kws) < n_keywords:
+        n_words = rng.integers(1, 5)
+        kw = " ".join(rng.choice(WORDS, n_words))
+        if rng.random() < 0.1:
+            kw = kw.title()  # keywords on CORDIS are not always lowercase
+        if kw not in seen:
+            seen.add(kw)
+            generated_kws.append(kw)
+    rng.shuffle(generated_kws)
+    return (kws + generated_kws)[:n_keywords]
+
+
+def draw_keywords(rng: np.random.Generator, vocabulary: list[str], n_projects: int, mean: float) -> list[list[str]]:
+    # Zipf-like: keyword i is drawn with probability ~ 1 / (i + 10)
+    weights = 1 / (np.arange(len(vocabulary)) + 10)
+    counts = rng.poisson(mean, n_projects)
+    draws = rng.choice(len(vocabulary), counts.sum(), p=weights / weights.sum())
+    vocabulary = np.array(vocabulary, dtype=object)
+    return [vocabulary[kw_ids].tolist() for kw_ids in np.split(draws, np.cumsum(counts)[:-1])]
+
+
+def make_topics(rng: np.random.Generator, n_projects: int) -> np.ndarray:
+    topics = []
+    for topic_format in TOPIC_FORMATS:
+        for year in range(2021, 2025):
+            for i in range(1, 6):
+                topics.append(topic_format.format(n=rng.integers(1, 7), year=year, d=rng.integers(1, 10), i=i))
+    return rng.choice(np.array(topics, dtype=object), n_projects)
+
+
+def format_ec_max(rng: np.random.Generator, ec_max: np.ndarray) -> list:
+    # mostly "1234.5", some with a decimal comma, some missing, like the export
+    values = []
+    for value, kind in zip(ec_max, rng.random(len(ec_max))):
+        if kind < 0.02:
+            values.append(None)
+        elif kind < 0.1:
+            values.append(f"{value:.2f}".replace(".", ","))
+        else:
+            values.append(f"{value:.2f}")
+    return values
+
+
+def make_kw_categorizations(rng: np.random.Generator, vocabulary: list[str]) -> pd.DataFrame:
+    """
+    kw_categorizations.csv for the vocabulary: category keywords get their category, about a third of
+    the other keywords some random categories, with subcategories and subsubcategories where there are any.
+    """
+    with open(CATEGORIZATION_DIR / "categories.json", "r") as f:
+        category_kws = json.load(f)
+    with open(CATEGORIZATION_DIR / "subcategories.json", "r") as f:
+        subcategories = json.load(f)
+    with open(CATEGORIZATION_DIR / "subsubcategories.json", "r") as f:
+        subsubcategories = json.load(f)
+    kw_category = {kw: category for category, kws in category_kws.items() for kw in kws}
+    category_names = list(category_kws.keys())
+
+    kws = sorted({normalize_keyword(kw) for kw in vocabulary})
+    rows = []
+    for kw in kws:
+        if kw in kw_category:
+            categories = [kw_category[kw]]
+        elif rng.random() < 0.33:
+            categories = [str(category) for category in rng.choice(category_names, rng.integers(1, 4), replace=False)]
+        else:
+            categories = []
+        subs = [(category, sub) for category in categories for sub in subcategories.get(category, {}) if rng.random() < 0.3]
+        subsubs = [(sub, subsub) for _, sub in subs for subsub in subsubcategories.get(sub, {}) if rng.random() < 0.3]
+        rows.append([int(rng.integers(1, 100)), kw, categories, subs, subsubs])
+    return pd.DataFrame(rows, columns=["count", "kw", "categories", "subcategories", "subsubcategories"])
+
+
+def make_page(rng: np.random.Generator, project_id: int, kws: list[str], size: int) -> str:
+    # CORDIS pages have a large <head> with scripts and styles before and after the keywords tag
+    filler = " ".join(rng.choice(WORDS, 60))
+    head = "\n".join(
+        f"<script src=\"/assets/js/chunk-{i}.js\"></script><link rel=\"stylesheet\" href=\"/assets/css/{i}.css\">" for i in range(40)
+    )
+    body = PAGE_FILLER.format(filler) * max(1, size // len(PAGE_FILLER.format(filler)))
+    keywords = ",".join(kws).replace("\"", "&quot;")
+    return (
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"utf-8\">\n"
+        f"<title>Project {project_id} | CORDIS | European Commission</title>\n{head}\n"
+        f"<meta name=\"description\" content=\"{filler[:150]}\">\n"
+        f"<meta name=\"keywords\" content=\"{keywords}\">\n"
+        f"<meta property=\"og:title\" content=\"Project {project_id}\">\n</head>\n<body>\n{body}</body>\n</html>\n"
+    )
+
+
+def generate(out_dir: Path, n_projects: int, n_keywords: int | None = None, n_pages: int = 200, page_size: int = 150_000, seed: int = 0) -> dict:
+    """
+    Write the synthetic dataset to out_dir, returns its description (also written to out_dir/dataset.json).
+    """
+    rng = np.random.default_rng(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n_keywords = n_keywords if n_keywords is not None else max(1_000, min(n_projects, 200_000) // 2)
+    vocabulary = make_vocabulary(rng, n_keywords)
+
+    print(f"Generating {n_projects} projects ...")
+    ids = np.arange(100_000, 100_000 + n_projects)
+    topics = make_topics(rng, n_projects)
+    ec_max = rng.lognormal(13.5, 1.2, n_projects).round(2)
+    cordis_keywords = draw_keywords(rng, vocabulary, n_projects, 6)
+    euroscivoc_keywords = draw_keywords(rng, vocabulary, n_projects, 2)
+
+    project_df = pd.DataFrame({col: "x" for col in PROJECT_COLUMNS}, index=range(n_projects))
+    project_df["id"] = ids
+    project_df["topics"] = topics
+    project_df["ecMaxContribution"] = format_ec_max(rng, ec_max)
+    project_df["contentUpdateDate"] = "2024-11-04 10:00:00"
+    project_df["rcn"] = np.arange(n_projects)
+    project_df.to_csv(out_dir / "project.csv", index=False)
+
+    euroscivoc_df = pd.DataFrame({"projectID": ids, "euroSciVocTitle": euroscivoc_keywords}).explode("euroSciVocTitle").dropna()
+    euroscivoc_df["euroSciVocCode"] = "/29/97/181"
+    euroscivoc_df["euroSciVocPath"] = "/natural sciences/computer and information sciences/" + euroscivoc_df["euroSciVocTitle"]
+    euroscivoc_df["euroSciVocDescription"] = ""
+    euroscivoc_df[["projectID", "euroSciVocCode", "euroSciVocPath", "euroSciVocTitle", "euroSciVocDescription"]].to_csv(out_dir / "euroSciVoc.csv", index=False)
+
+    # some pages fail or have no keywords, like when scraping
+    status = rng.random(n_projects)
+    extracted_df = pd.DataFrame({
+        "id": ids,
+        "ecMaxContribution": ec_max,
+        "topics": topics,
+        "cluster": KeywordExtractorEU(cli=False)._get_cluster_series(pd.Series(topics, dtype="category")),
+        "euroscivoc_keywords": [kws if len(kws) > 0 else None for kws in euroscivoc_keywords],
+        "cordis_keywords": [kws if s > 0.02 else ("ERROR" if s > 0.01 else "NOT FOUND") for kws, s in zip(cordis_keywords, status)],
+    })
+    extracted_df.to_csv(out_dir / "extracted.csv", index=False)
+
+    make_kw_categorizations(rng, vocabulary).to_csv(out_dir / "kw_categorizations.csv", index=False)
+
+    pages_dir = out_dir / "pages"
+    pages_dir.mkdir(exist_ok=True)
+    for project_id, kws in zip(ids[:n_pages], cordis_keywords[:n_pages]):
+        (pages_dir / f"{project_id}.html").write_text(make_page(rng, project_id, kws, page_size), encoding="utf-8")
+
+    description = {"projects": n_projects, "keywords": n_keywords, "pages": min(n_pages, n_projects), "page_size": page_size, "seed": seed}
+    with open(out_dir / "dataset.json", "w") as f:
+        json.dump(description, f, indent=2)
+    return description
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--projects", "-n", default=10_000, type=int)
+    parser.add_argument("--keywords", "-k", default=None, type=int, help="distinct keywords (default: half the projects, 1k to 100k)")
+    parser.add_argument("--pages", "-p", default=200, type=int, help="number of project pages to write")
+    parser.add_argument("--page-size", default=150_000, type=int, help="approximate size of a page in bytes")
+    parser.add_argument("--seed", "-s", default=0, type=int)
+    parser.add_argument("--out", "-o", default=None, type=Path, help="default: benchmarks/data/<projects>")
+    args = parser.parse_args()
+
+    out_dir = args.out if args.out is not None else ROOT / "benchmarks" / "data" / str(args.projects)
+    generate(out_dir, args.projects, args.keywords, args.pages, args.page_size, args.seed)
+    print(f"Written to {out_dir}")
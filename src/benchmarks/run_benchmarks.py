@@ -0,0 +1,198 @@
+"""
+Times the hot paths of the pipeline separately on a dataset of generate_data.py and writes the results
+as JSON (with the commit they were run on), so runs can be compared across commits:
+    parse           keywords from project pages (BeautifulSoup and streaming parser): the CORDIS fixture pages
+                    (benchmarks/pages, see fetch_pages.py) or --pages, the synthetic pages of the dataset without them
+    ingestion       reading project.csv and euroSciVoc.csv (extract_keywords.py, without scraping)
+    read_extracted  reading extracted.csv
+    vocabulary      building the keyword vocabulary of extracted.csv
+    aggregation     keyword counts and ecMaxContribution per cluster (get_most_occurring_keywords.py), vocabulary included
+    keyword_mapping Categorizer on a sample of the keywords (get_keyword_mappings.py), needs the NLTK data
+    categorization  assigning (sub)categories to the projects (categorize.py), vocabulary included
+    table           overview table rollups (gen_table.py)
+
+usage: python benchmarks/run_benchmarks.py --data benchmarks/data/10000
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "code"))
+sys.path.insert(0, str(ROOT / "categorization"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+import pandas as pd
+from bench_parse import bench_parse, load_pages
+from fetch_pages import PAGES_DIR
+from categorize import categorize_projects, process_categories
+from extract_keywords import KeywordExtractorEU
+from gen_table import get_table_nodes, membership_matrix
+from generate_data import generate
+from get_most_occurring_keywords import aggregate_keywords
+from normalize import normalize_keyword
+from tables import CATEGORY_COLUMNS, read_table
+from vocabulary import Vocabulary
+
+BENCHMARKS = ["parse", "ingestion", "read_extracted", "vocabulary", "aggregation", "keyword_mapping", "categorization", "table"]
+
+
+def time_func(func, repeat: int) -> tuple[dict, object]:
+    """
+    Run func repeat times, returns the best and mean time in seconds and the result of the last run.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return {"seconds": min(times), "mean_seconds": sum(times) / len(times), "repeat": repeat}, result
+
+
+def git_commit() -> dict:
+    def git(*args: str) -> str:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD"), "dirty": git("status", "--porcelain", "--untracked-files=no") != ""}
+
+
+def bench_keyword_mapping(kws: list[str], subcategory_dict: dict, subsubcategory_dict: dict) -> dict:
+    # the Categorizer reads its files from the categorization folder
+    from categorizer import Categorizer
+
+    cwd = os.getcwd()
+    os.chdir(ROOT / "categorization")
+    try:
+        init, categorizer = time_func(lambda: Categorizer(snapshot_file=None), 1)
+
+        def categorize():
+            categorizer.kw_cache = {}
+            for kw in kws:
+                categorizer.categorize(kw, subcategory_dict, subsubcategory_dict)
+        result, _ = time_func(categorize, 1)
+    finally:
+        os.chdir(cwd)
+    result.update({"init_seconds": init["seconds"], "keywords": len(kws), "per_keyword": result["seconds"] / max(1, len(kws))})
+    result["similarity"] = dict(categorizer.similarity.stats)
+    return result
+
+
+def run_benchmarks(data_dir: Path, names: list[str], repeat: int, map_keywords: int, pages_dir: Path | None = None) -> dict:
+    results = {}
+
+    def record(name: str, func, **info) -> object:
+        print(f"{name} ...", flush=True)
+        timing, result = time_func(func, repeat)
+        results[name] = {**timing, **info}
+        print(f"    {timing['seconds']:.3f}s")
+        return result
+
+    if "parse" in names:
+        if pages_dir is None and any(PAGES_DIR.glob("*.html")):
+            pages_dir = PAGES_DIR
+        pages = load_pages(pages_dir if pages_dir is not None else data_dir / "pages")
+        print("parse ...", flush=True)
+        results["parse"] = bench_parse(pages, repeat)
+        results["parse"]["source"] = str(pages_dir) if pages_dir is not None else "synthetic"
+        print(f"    full {results['parse']['full'] * 1e3:.3f} ms/page, fast {results['parse']['fast'] * 1e3:.3f} ms/page")
+
+    if "ingestion" in names:
+        extractor = KeywordExtractorEU(cli=False)
+        extractor.args.projectfile = data_dir / "project.csv"
+        extractor.args.euroscivocfile = data_dir / "euroSciVoc.csv"
+        record("ingestion", extractor.process_csv_files)
+
+    # the later steps build on each other, they run when needed even if not timed
+    extracted_df = None
+    if any(name in names for name in ["read_extracted", "aggregation", "categorization", "table"]):
+        read = lambda: read_table(data_dir / "extracted.csv").reset_index(drop=True)
+        extracted_df = record("read_extracted", read) if "read_extracted" in names else read()
+
+    # aggregation and categorization build the vocabulary in the timed run, like the scripts without a saved one,
+    # so their timings cover the whole keyword pass and compare with the scripts before the vocabulary
+    build = lambda: Vocabulary.from_table(data_dir / "extracted.csv")
+    vocabulary = None
+    if "vocabulary" in names:
+        vocabulary = record("vocabulary", build)
+
+    if "aggregation" in names:
+        keywords, *_ = record("aggregation", lambda: aggregate_keywords(extracted_df, build()))
+        results["aggregation"]["keywords"] = len(keywords)
+
+    with open(ROOT / "categorization" / "subcategories.json", "r") as f:
+        subcategory_dict = json.load(f)
+    with open(ROOT / "categorization" / "subsubcategories.json", "r") as f:
+        subsubcategory_dict = json.load(f)
+
+    if "keyword_mapping" in names:
+        print("keyword_mapping ...", flush=True)
+        vocabulary = vocabulary if vocabulary is not None else build()
+        kws = vocabulary.keys(normalize_keyword)[0]  # the keywords get_keyword_mappings.py maps
+        kws = kws[::max(1, len(kws) // map_keywords)][:map_keywords]
+        try:
+            results["keyword_mapping"] = bench_keyword_mapping(kws, subcategory_dict, subsubcategory_dict)
+            print(f"    {results['keyword_mapping']['per_keyword'] * 1e3:.3f} ms/keyword")
+        except (LookupError, OSError) as e:  # e.g. the NLTK data is not installed
+            results["keyword_mapping"] = {"skipped": str(e).strip().splitlines()[0]}
+            print(f"    skipped: {results['keyword_mapping']['skipped']}")
+
+    categorized = None
+    if "categorization" in names or "table" in names:
+        kw_mappings_df = pd.read_csv(data_dir / "kw_categorizations.csv")
+        for col in CATEGORY_COLUMNS:
+            kw_mappings_df[col] = kw_mappings_df[col].map(process_categories)
+        categorize = lambda: categorize_projects(extracted_df, kw_mappings_df, build())
+        categorized = record("categorization", categorize) if "categorization" in names else categorize()
+
+    if "table" in names:
+        with open(ROOT / "categorization" / "categories.json", "r") as f:
+            categories = json.load(f)
+        table_nodes = get_table_nodes(categories, subcategory_dict, subsubcategory_dict)
+        nodes = pd.Index(sorted({[node for node in table_node if node is not None][-1] for table_node in table_nodes}))
+        ec_max = extracted_df["ecMaxContribution"].fillna(0).to_numpy(dtype=float)
+
+        def table():
+            membership = membership_matrix(categorized, nodes)
+            return membership.sum(axis=0), ec_max @ membership
+        record("table", table, nodes=len(nodes))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", "-d", default=None, type=Path, help="dataset of generate_data.py (default: benchmarks/data/<projects>)")
+    parser.add_argument("--projects", "-n", default=10_000, type=int, help="generate a dataset of this size if --data does not exist")
+    parser.add_argument("--benchmarks", "-b", nargs="+", default=BENCHMARKS, choices=BENCHMARKS)
+    parser.add_argument("--repeat", "-r", default=3, type=int)
+    parser.add_argument("--pages", "-p", default=None, type=Path, help="saved CORDIS pages to parse (default: the fixture pages in benchmarks/pages, else the synthetic pages of the dataset)")
+    parser.add_argument("--map-keywords", "-mk", default=500, type=int, help="number of keywords for keyword_mapping")
+    parser.add_argument("--out", "-o", default=None, type=Path, help="results file (default: benchmarks/results/<date>-<commit>.json)")
+    args = parser.parse_args()
+
+    data_dir = args.data if args.data is not None else ROOT / "benchmarks" / "data" / str(args.projects)
+    if not (data_dir / "dataset.json").exists():
+        generate(data_dir, args.projects)
+    with open(data_dir / "dataset.json", "r") as f:
+        dataset = json.load(f)
+
+    commit = git_commit()
+    report = {
+        **commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "dataset": dataset,
+        "results": run_benchmarks(data_dir, args.benchmarks, args.repeat, args.map_keywords, args.pages),
+    }
+
+    out_file = args.out
+    if out_file is None:
+        out_file = ROOT / "benchmarks" / "results" / f"{datetime.now():%Y%m%d-%H%M%S}-{commit['commit'][:8]}.json"
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_file, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Written to {out_file}")
@@ -1,26 +1,76 @@
+import argparse
 import ast
+import sys
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
+from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "code"))
+from metrics import metrics
+from normalize import match_keyword
+from tables import CATEGORY_COLUMNS, read_table, write_table
+from vocabulary import Vocabulary, get_vocabulary
 
-def get_categories(euroscivoc_kws, cordis_kw):
-    euroscivoc_kws = ast.literal_eval(euroscivoc_kws) if pd.notna(euroscivoc_kws) else []
-    cordis_kw = ast.literal_eval(cordis_kw) if pd.notna(cordis_kw) else []
-    categories = set()
-    subcategories = set()
-    subsubcategories = set()
+MATCH_COLUMNS = ["euroscivoc_keywords", "cordis_keywords"]  # the labels of the euroSciVoc keywords come first
 
-    kws = set(euroscivoc_kws).union(cordis_kw)
-    for kw in kws:
-        kw = kw.lower().strip()
-        categories = categories.union(set(categories_dict.get(kw, [])))
-        subcategories = subcategories.union(set(subcategories_dict.get(kw, [])))
-        subsubcategories = subsubcategories.union(set(subsubcategories_dict.get(kw, [])))
 
-    categories = list(categories) if len(categories) > 0 else None
-    subcategories = list(subcategories) if len(subcategories) > 0 else None
-    subsubcategories = list(subsubcategories) if len(subsubcategories) > 0 else None
-    return (categories, subcategories, subsubcategories)
+def project_keyword_ids(vocabulary: Vocabulary, kw_ids: pd.Index) -> pd.DataFrame:
+    """
+    (row, kw_id) pairs of the keywords of every project that have a mapping, in project order.
+    Keywords are matched lowercased and stripped (quotes kept).
+    """
+    keys, rows, key_ids = vocabulary.key_pairs(match_keyword, MATCH_COLUMNS)
+    kw_id = kw_ids.get_indexer(pd.Index(keys, dtype=object))[key_ids]
+    return pd.DataFrame({"row": rows[kw_id >= 0], "kw_id": kw_id[kw_id >= 0]})
+
+
+def categorize_projects(extracted_df: pd.DataFrame, kw_mappings_df: pd.DataFrame, vocabulary: Vocabulary) -> pd.DataFrame:
+    """
+    The categories, subcategories and subsubcategories of every project: the union of those of its keywords,
+    None if there are none. The labels per project come from joining the project x keyword pairs of
+    the vocabulary with the keyword x label pairs of every column.
+    """
+    kw_mappings_df = kw_mappings_df.dropna(subset=["kw"]).drop_duplicates("kw", keep="last").reset_index(drop=True)
+    kw_ids = pd.Index(kw_mappings_df["kw"])
+    extracted_df = extracted_df.reset_index(drop=True)
+    project_kws = project_keyword_ids(vocabulary, kw_ids)
+
+    categorized = pd.DataFrame(index=extracted_df.index)
+    for col in CATEGORY_COLUMNS:
+        kw_labels = kw_mappings_df[col].explode().dropna()
+        kw_labels = pd.DataFrame({"kw_id": kw_labels.index.to_numpy(), col: kw_labels.to_numpy()})
+        # an inner merge keeps the order of project_kws, so the labels stay grouped per row
+        labels = project_kws.merge(kw_labels, on="kw_id", sort=False).drop_duplicates(["row", col])
+        rows = labels["row"].to_numpy()
+        starts = np.flatnonzero(np.diff(rows, prepend=-1))
+        row_labels = pd.Series([chunk.tolist() for chunk in np.split(labels[col].to_numpy(), starts)[1:]], index=rows[starts], dtype=object)
+        categorized[col] = row_labels.reindex(categorized.index)
+        categorized[col] = categorized[col].where(categorized[col].notna(), None)
+    return categorized
+
+
+def categorize_delta(extracted_df: pd.DataFrame, kw_mappings_df: pd.DataFrame, categorized_file: str, changed_ids: pd.Series) -> pd.DataFrame:
+    """
+    Same as categorize_projects, but only the projects in changed_ids (or not in categorized_file yet) are
+    categorized, the others keep their categories in categorized_file.
+    """
+    extracted_df = extracted_df.reset_index(drop=True)
+    previous_df = read_table(categorized_file).drop_duplicates("id", keep="last").set_index("id")
+    redo = extracted_df["id"].isin(changed_ids) | ~extracted_df["id"].isin(previous_df.index)
+    print(f"Categorizing {redo.sum()} changed projects, {len(redo) - redo.sum()} unchanged")
+    metrics.count("projects_changed", int(redo.sum()))
+
+    vocabulary = Vocabulary()
+    vocabulary.add_projects(extracted_df.loc[redo])
+    changed = categorize_projects(extracted_df.loc[redo], kw_mappings_df, vocabulary)
+    categorized = pd.DataFrame(index=extracted_df.index)
+    for col in CATEGORY_COLUMNS:
+        labels = extracted_df["id"].map(previous_df[col]).tolist()
+        for pos, project_labels in zip(np.flatnonzero(redo.to_numpy()), changed[col]):
+            labels[pos] = project_labels
+        categorized[col] = pd.Series(labels, index=extracted_df.index, dtype=object)
+        categorized[col] = categorized[col].where(categorized[col].notna(), None)
+    return categorized
 
 
 def process_categories(s: str):
@@ -32,15 +82,37 @@ def process_categories(s: str):
 
     return ast.literal_eval(s)
 
-kw_mappings_df = pd.read_csv("kw_categorizations.csv")
-kw_mappings_df["categories"] = kw_mappings_df["categories"].map(process_categories)
-categories_dict = kw_mappings_df.set_index("kw")["categories"].map(list).to_dict()
-kw_mappings_df["subcategories"] = kw_mappings_df["subcategories"].map(process_categories)
-subcategories_dict = kw_mappings_df.set_index("kw")["subcategories"].map(list).to_dict()
-kw_mappings_df["subsubcategories"] = kw_mappings_df["subsubcategories"].map(process_categories)
-subsubcategories_dict = kw_mappings_df.set_index("kw")["subsubcategories"].map(list).to_dict()
-
-extracted_df = pd.read_csv("../out/extracted.csv")
-tqdm.pandas(desc="Assign keywords", leave=True, miniters=10)
-extracted_df[["categories", "subcategories", "subsubcategories"]] = extracted_df.progress_apply(lambda row: get_categories(row.euroscivoc_keywords, row.cordis_keywords), axis=1).apply(pd.Series)
-extracted_df.to_csv("../out/categorized.csv", index=False)
+if __name__ == "__main__":
+    default_extracted_file = "../out/extracted.csv"
+    default_categorized_file = "../out/categorized.csv"
+    default_delta_ids_file = "../out/delta_ids.csv"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--extractedfile", "-ef", nargs='?', const=default_extracted_file, default=default_extracted_file, type=str, help=".csv, .parquet or .feather")
+    parser.add_argument("--outfile", "-of", nargs='?', const=default_categorized_file, default=default_categorized_file, type=str, help=".csv, .parquet or .feather")
+    parser.add_argument("--delta", "-d", nargs="?", const=default_delta_ids_file, default=None, type=str, help="only categorize the projects in this file (written by extract_keywords.py --delta), the others keep their categories in --outfile")
+    args = parser.parse_args()
+
+    with metrics.stage("read"):
+        kw_mappings_df = pd.read_csv("kw_categorizations.csv")
+        for col in CATEGORY_COLUMNS:
+            kw_mappings_df[col] = kw_mappings_df[col].map(process_categories)
+
+        extracted_df = read_table(args.extractedfile).reset_index(drop=True)
+    metrics.count("projects", len(extracted_df))
+    delta = args.delta is not None and Path(args.delta).exists() and Path(args.outfile).exists()
+    if args.delta is not None and not delta:
+        print(f"No {args.delta} or {args.outfile}, categorizing all projects")
+    if delta:
+        print("Assign keywords of the changed projects...")
+        with metrics.stage("categorize"):
+            extracted_df[CATEGORY_COLUMNS] = categorize_delta(extracted_df, kw_mappings_df, args.outfile, pd.read_csv(args.delta)["id"])
+    else:
+        with metrics.stage("vocabulary"):
+            vocabulary = get_vocabulary(args.extractedfile)
+        metrics.count("keywords", len(vocabulary))
+        print("Assign keywords...")
+        with metrics.stage("categorize"):
+            extracted_df[CATEGORY_COLUMNS] = categorize_projects(extracted_df, kw_mappings_df, vocabulary)
+    with metrics.stage("write"):
+        write_table(extracted_df, args.outfile)
+    metrics.save("categorize")
@@ -1,30 +1,163 @@
 import ast
+import hashlib
 import json
+import os
+import pickle
+from collections import deque
+from pathlib import Path
+from typing import NamedTuple
+import nltk
 import numpy as np
 import pandas as pd
-import re
-from nltk import pos_tag, word_tokenize
+import sys
+from nltk import pos_tag, pos_tag_sents, word_tokenize
 from nltk.corpus import wordnet
 from nltk.corpus.reader.wordnet import Synset
 from nltk.wsd import lesk
 from unidecode import unidecode
+from similarity import SimilarityCache
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "code"))
+from metrics import metrics
+from normalize import keyword_tokens, strip_keyword
 
 SIMILARITY_THRESH = 0.95  # wup similarity must be bigger or equal for a match
+SNAPSHOT_VERSION = 1  # bump when the snapshot contents or the way they are computed change
+
+
+def nlp_version() -> str:
+    return f"nltk {nltk.__version__}, wordnet {wordnet.get_version()}"
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a list of keywords, finds all keywords that
+    occur as a substring of a text in a single pass over the text.
+    """
+    def __init__(self, keywords: list[str]) -> None:
+        self.goto = [{}]  # {char: next node} per node
+        self.fail = [0]   # longest proper suffix of the node that is also a node
+        self.out = [[]]   # keywords ending at the node
+        for kw in keywords:
+            node = 0
+            for char in kw:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = next_node
+            self.out[node].append(kw)
+
+        # Breadth first, so the fail node of a node is always done before the node itself.
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self.goto[node].items():
+                queue.append(next_node)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_node] = fail if fail != next_node else 0
+                self.out[next_node] = self.out[next_node] + self.out[self.fail[next_node]]
+
+    def find_all(self, text: str) -> set[str]:
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            found.update(self.out[node])
+        return found
+
+
+class KeywordCategories(NamedTuple):
+    categories: list[str]
+    subcategories: list[tuple[str, str]]  # (category, subcategory)
+    subsubcategories: list[tuple[str, str]]  # (subcategory, subsubcategory)
 
 
 class Categorizer:
-    def __init__(self) -> None:
+    def __init__(self, similarity_cache_file: str | None = None, snapshot_file: str | None = "categorizer_snapshot.pkl") -> None:
         print("Initializing Categorizer...")
-        self.kw_cache = {}
-        self._init_mappings()
-        self.ignore_kws = []
-        with open("ignore_kws.txt", "r") as f:
-            for line in f.readlines():
-                if line.strip() != "":
-                    self.ignore_kws.append(line)
+        self.similarity = SimilarityCache(SIMILARITY_THRESH, cache_file=similarity_cache_file)
+        self.synsets_cache = {}  # {kw: synsets}
+        self.wordnet_cache = {}  # {word: wordnet.synsets(word)}
+        self.lesk_cache = {}  # {(context, token, pos): synset}
+        self.n_tokens_cache = {}  # {compare_kw: len(word_tokenize(compare_kw))}
+        self.snapshot_file = snapshot_file
+        if snapshot_file is not None and self._load_snapshot():
+            print(f"* Loaded from snapshot {snapshot_file}")
+        else:
+            self.kw_cache = {}
+            self._init_mappings()
+            self.ignore_kws = []
+            with open("ignore_kws.txt", "r") as f:
+                for line in f.readlines():
+                    if line.strip() != "":
+                        self.ignore_kws.append(line)
+
+            print("* Getting keyword synsets...")
+            self._init_kw_synsets()
+            if snapshot_file is not None:
+                self.save_snapshot()
+        self._init_index()
+
+    def save_snapshot(self) -> None:
+        """
+        Save the initialized state and the kw_cache, so the next Categorizer with the same
+        categories.json, ignore_kws.txt and NLTK data can start without WordNet lookups.
+        """
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "key": self._snapshot_key(),
+            "category_kws": self.category_kws,
+            "ignore_kws": self.ignore_kws,
+            "kw_category": self.kw_category,
+            "kw_kw_stripped": self.kw_kw_stripped,
+            "kw_synsets": {
+                kw: None if synsets is None else [[s.name() for s in token_synsets] for token_synsets in synsets]
+                for kw, synsets in self.kw_synsets.items()
+            },
+            "kw_cache": self.kw_cache,
+        }
+        # write to a temp file first, other processes may be loading the snapshot
+        tmp_file = f"{self.snapshot_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            pickle.dump(snapshot, f)
+        os.replace(tmp_file, self.snapshot_file)
+
+    def _load_snapshot(self) -> bool:
+        if not Path(self.snapshot_file).exists():
+            return False
+        with open(self.snapshot_file, "rb") as f:
+            snapshot = pickle.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("key") != self._snapshot_key():
+            print(f"* Snapshot {self.snapshot_file} is stale, rebuilding")
+            return False
+
+        self.category_kws = snapshot["category_kws"]
+        self.ignore_kws = snapshot["ignore_kws"]
+        self.kw_category = snapshot["kw_category"]
+        self.kw_kw_stripped = snapshot["kw_kw_stripped"]
+        self.kw_synsets = {
+            kw: None if names is None else [[wordnet.synset(name) for name in token_names] for token_names in names]
+            for kw, names in snapshot["kw_synsets"].items()
+        }
+        self.kw_cache = snapshot["kw_cache"]
+        return True
 
-        print("* Getting keyword synsets...")
-        self._init_kw_synsets()
+    def _snapshot_key(self) -> str:
+        # hash of everything the initialized state depends on
+        key = hashlib.sha256()
+        for file in ["./categories.json", "ignore_kws.txt"]:
+            key.update(Path(file).read_bytes() if Path(file).exists() else b"")
+        key.update(nlp_version().encode())
+        return key.hexdigest()
 
     def _init_mappings(self) -> None:
         with open("./categories.json") as f:
@@ -40,7 +173,7 @@ class Categorizer:
         for category, kws in self.category_kws.items():
             for kw in kws:
                 self.kw_category[kw] = category
-                kw_stripped = re.sub(r"[^a-zA-Z0-9]", "", unidecode(kw.lower()))
+                kw_stripped = strip_keyword(kw)
                 self.kw_kw_stripped[kw] = kw_stripped
                 self.kw_cache[kw_stripped] = category
 
@@ -50,9 +183,37 @@ class Categorizer:
             kw: [[token0_synset0, token0_synset1, ...], [token1_synset0, token1_synset1, ...], ...]
         }
         """
-        self.kw_synsets = {}
-        for kw in self.kw_category.keys():
-            self.kw_synsets[kw] = self._get_synsets(kw)
+        kws = list(self.kw_category.keys())
+        self.kw_synsets = dict(zip(kws, self.get_synsets_batch(kws)))
+
+    def _init_index(self) -> None:
+        """
+        Precompute the category keyword lookups of get_categories:
+        stripped kw -> categories (direct and token matches), an automaton over the
+        kws long enough for a part match and, per category, the synsets of the kws
+        that qualify for a synset comparison.
+        """
+        self.stripped_kw_categories = {}  # {kw_stripped: [categories]}
+        self.category_synsets = {}  # {category: [compare_synsets]}
+        part_kws = []
+        for compare_kw, compare_synsets in self.kw_synsets.items():
+            compare_category = self.kw_category[compare_kw]
+            self.stripped_kw_categories.setdefault(self.kw_kw_stripped[compare_kw], []).append(compare_category)
+
+            # Only compare synsets if a synset could be found for at least 3/4 of the tokens in compare_kw.
+            if compare_synsets is not None and len(compare_synsets) >= (self._n_tokens(compare_kw) * 0.75):
+                self.category_synsets.setdefault(compare_category, []).append(compare_synsets)
+
+            if len(compare_kw) > 4:
+                part_kws.append(compare_kw)
+        self.part_automaton = KeywordAutomaton(part_kws)
+
+    def _n_tokens(self, compare_kw: str) -> int:
+        n_tokens = self.n_tokens_cache.get(compare_kw)
+        if n_tokens is None:
+            n_tokens = len(word_tokenize(compare_kw))
+            self.n_tokens_cache[compare_kw] = n_tokens
+        return n_tokens
 
     def _get_wordnet_pos(self, pos_tag: str) -> str | None:
         if pos_tag.startswith("J"):
@@ -66,22 +227,59 @@ class Categorizer:
 
         return None
 
+    def get_synsets_batch(self, kws: list[str]) -> list[list[list[Synset]] | None]:
+        """
+        _get_synsets for many keywords at once, the keywords that need POS tags are tagged
+        in a single pos_tag_sents call. The results are cached for later _get_synsets calls.
+        """
+        kws = [kw.strip() for kw in kws]
+        untagged_kws = []
+        for kw in dict.fromkeys(kws):
+            if kw not in self.synsets_cache and len(self._get_kw_wordnet_synsets(kw)) == 0:
+                untagged_kws.append(kw)
+
+        tagged_kws = pos_tag_sents([word_tokenize(kw) for kw in untagged_kws])
+        for kw, pos_tags in zip(untagged_kws, tagged_kws):
+            self.synsets_cache[kw] = self._compute_synsets(kw, pos_tags)
+        return [self._get_synsets(kw) for kw in kws]
+
     def _get_synsets(self, kw: str) -> list[list[Synset]] | None:
         kw = kw.strip()
+        if kw not in self.synsets_cache:
+            self.synsets_cache[kw] = self._compute_synsets(kw)
+        return self.synsets_cache[kw]
+
+    def _get_wordnet_synsets(self, word: str) -> list[Synset]:
+        # shared between keywords, so callers must not modify the returned list
+        if word not in self.wordnet_cache:
+            self.wordnet_cache[word] = wordnet.synsets(word)
+        return self.wordnet_cache[word]
+
+    def _get_kw_wordnet_synsets(self, kw: str) -> list[Synset]:
+        all_synsets = self._get_wordnet_synsets(kw)
+        if len(all_synsets) == 0:  # No match, try decoding.
+            all_synsets = self._get_wordnet_synsets(unidecode(kw))
+        return all_synsets
+
+    def _get_lesk(self, context: list[str], token: str, pos: str, synsets: list[Synset]) -> Synset | None:
+        # synsets only depend on token and pos, so they are not part of the key
+        key = (tuple(context), token, pos)
+        if key not in self.lesk_cache:
+            self.lesk_cache[key] = lesk(context, token, pos=pos, synsets=synsets)
+        return self.lesk_cache[key]
 
+    def _compute_synsets(self, kw: str, pos_tags: list[tuple[str, str]] | None = None) -> list[list[Synset]] | None:
         # Generate all synsets
         # Try the whole keyword
-        all_synsets = wordnet.synsets(kw)
-        if len(all_synsets) == 0:  # No match, try decoding.
-            all_synsets = wordnet.synsets(unidecode(kw))
+        all_synsets = list(self._get_kw_wordnet_synsets(kw))
 
         if len(all_synsets) >= 1:  # Found synsets, return them.
             return [[s for s in all_synsets if isinstance(s, Synset)]]
 
         # If the whole kw is not recognized, try the individual tokens.
-        tokens = word_tokenize(kw)
+        tokens = word_tokenize(kw) if pos_tags is None else [t for t, _ in pos_tags]
         for token in tokens:
-            token_synsets = wordnet.synsets(token)
+            token_synsets = self._get_wordnet_synsets(token)
             if len(token_synsets) > 0:
                 all_synsets.append(token_synsets)
             else:
@@ -93,7 +291,8 @@ class Categorizer:
         # Filter synsets according to POS
         selected_synsets = []
 
-        pos_tags = pos_tag(tokens)
+        if pos_tags is None:
+            pos_tags = pos_tag(tokens)
         context = [t for t, _ in pos_tags]
         for i in range(len(tokens)):
             token_synsets = all_synsets[i]
@@ -116,7 +315,7 @@ class Categorizer:
 
             # Select synsets with Word Sense Disambiguation
             if len(selected_token_synsets) > 1:
-                selected_synset_no_context = lesk(context, token, pos=wordnet_pos, synsets=selected_token_synsets)  # use whole keyword as context
+                selected_synset_no_context = self._get_lesk(context, token, wordnet_pos, selected_token_synsets)  # use whole keyword as context
                 selected_synsets_wsd = set()
                 if selected_synset_no_context is not None:
                     selected_synsets_wsd.add(selected_synset_no_context)
@@ -164,7 +363,7 @@ class Categorizer:
             # Check if matching
             for comp_syn in compare_token:
                 for kw_syn in kw_token:
-                    sim_score = kw_syn.wup_similarity(comp_syn)
+                    sim_score = self.similarity.match_score(kw_syn, comp_syn)
                     if sim_score is not None and sim_score >= SIMILARITY_THRESH:
                         # print(comp_i, kw_syn, comp_syn)
                         matching = True
@@ -188,49 +387,79 @@ class Categorizer:
             return []
 
         kw = kw.lower()
-        kw_stripped = re.sub(r"[^a-zA-Z0-9]", "", unidecode(kw.lower()))
+        kw_stripped = strip_keyword(kw)
         if kw_stripped in self.kw_cache.keys():
+            metrics.count("kw_cache.hits")
             return self.kw_cache[kw_stripped]
+        metrics.count("kw_cache.misses")
 
-        kw_synsets = self._get_synsets(kw)
+        if kw_stripped in self.stripped_kw_categories:  # Direct match, return category
+            compare_category = self.stripped_kw_categories[kw_stripped][0]
+            self.kw_cache[kw_stripped] = [compare_category]
+            return [compare_category]
 
+        similarity_stats = dict(self.similarity.stats)
+        matches = list(self.match_categories(kw))
+        self._record_comparisons("get_categories", similarity_stats)
+        self.kw_cache[kw_stripped] = matches
+        return matches
+
+    def _record_comparisons(self, name: str, similarity_stats: dict) -> None:
+        # synset pairs compared and wup_similarity calls for one kw, since similarity_stats was taken
+        compared = sum(self.similarity.stats.values()) - sum(similarity_stats.values())
+        metrics.observe(f"{name}.synset_comparisons_per_kw", compared)
+        metrics.observe(f"{name}.wup_calls_per_kw", self.similarity.stats["computed"] - similarity_stats["computed"])
+
+    def match_categories(self, kw: str, categories: set[str] | None = None) -> set[str]:
+        """
+        The token, part and synset matches of get_categories, without the kw_cache and direct match.
+        Only the given categories are tried (default all), used to redo a kw for a few changed categories.
+        """
+        kw = kw.lower()
+
+        # Check which compare_kws are one of the tokens in kw
         token_matches = set()
-        part_matches = set()
-        for compare_kw, compare_synsets in self.kw_synsets.items():
-            compare_category = self.kw_category[compare_kw]
+        for kw_token in keyword_tokens(kw):
+            token_matches.update(self.stripped_kw_categories.get(kw_token, []))
+
+        # Check which compare_kws are part of kw
+        part_matches = {self.kw_category[compare_kw] for compare_kw in self.part_automaton.find_all(kw)}
+
+        if categories is not None:
+            token_matches &= categories
+            part_matches &= categories
 
-            if kw_stripped == self.kw_kw_stripped[compare_kw]:  # Direct match, return category
-                self.kw_cache[kw_stripped] = [compare_category]
-                return [compare_category]
-
-            if compare_category not in token_matches:
-                # Check if compare_kw is one of the tokens in kw
-                kw_tokens = [re.sub(r"[^a-zA-Z0-9]", "", unidecode(s.lower())) for s in re.split(r"[\s\-_/#@\.,\(\)\[\]\|\&]", kw)]
-                compare_stripped = re.sub(r"[^a-zA-Z0-9]", "", unidecode(compare_kw.lower()))
-                found_match = False
-                for kw_token in kw_tokens:
-                    if kw_token == compare_stripped:  # compare_kw is a match for one of the tokens in kw.
+        # A synset match can only add categories that did not match yet, skip the others.
+        kw_synsets = self._get_synsets(kw)
+        if kw_synsets is not None:
+            for compare_category, category_synsets in self.category_synsets.items():
+                if compare_category in token_matches or compare_category in part_matches:
+                    continue
+                if categories is not None and compare_category not in categories:
+                    continue
+                for compare_synsets in category_synsets:
+                    match_score = self._synsets_match(kw_synsets, compare_synsets)
+                    if match_score > 0:
                         token_matches.add(compare_category)
-                        # print(f"Word match: {kw_token} ({kw}) -> {compare_kw} -> {compare_category}")
-                        found_match = True
+                        # print(f"Syn match {match_score}: {kw} ({len(kw_synsets)}) -> {compare_category}")
                         break
 
-                if not found_match and compare_synsets is not None and kw_synsets is not None:
-                    # Only compare synsets if a synset could be found for at least 3/4 of the tokens in compare_kw.
-                    if len(compare_synsets) >= (len(word_tokenize(compare_kw)) * 0.75):
-                        match_score = self._synsets_match(kw_synsets, compare_synsets)
-                        if match_score > 0:
-                            token_matches.add(compare_category)
-                            # print(f"Syn match {match_score}: {kw} ({len(kw_synsets)}) -> {compare_kw} -> {compare_category}")
-                            continue
+        return token_matches.union(part_matches)
 
-            if compare_category not in part_matches and compare_kw in kw and len(compare_kw) > 4:
-                part_matches.add(compare_category)
-                # print(f"Part match: {kw} -> {compare_kw} -> {compare_category}")
+    def categorize(self, kw: str, subcategories_dict: dict, subsubcategories_dict: dict) -> KeywordCategories:
+        """
+        The categories, subcategories and subsubcategories of kw in one pass down the category tree, the same as
+        get_categories followed by get_subcategory for both levels, without turning every level into a string and back.
+        """
+        if pd.isna(kw):
+            return KeywordCategories([], [], [])
 
-        matches = list(token_matches.union(part_matches))
-        self.kw_cache[kw_stripped] = matches
-        return matches
+        categories = self.get_categories(kw)
+        # category kws have a single category in the kw_cache, not a list
+        parents = [categories] if isinstance(categories, str) else categories
+        subcategories = self._match_subcategories(kw, parents, subcategories_dict)
+        subsubcategories = self._match_subcategories(kw, [str(subcategory) for _, subcategory in subcategories], subsubcategories_dict)
+        return KeywordCategories(categories, subcategories, subsubcategories)
 
     def get_subcategory(self, kw: str, categories: str, subcategories_dict: dict) -> list[tuple[str, str]]:
         if pd.isna(kw):
@@ -248,7 +477,10 @@ class Categorizer:
             return []
         if type(categories[0]) is (tuple):
             categories = np.array(categories)[:, 1]
+        return self._match_subcategories(kw, categories, subcategories_dict)
 
+    def _match_subcategories(self, kw: str, categories: list[str], subcategories_dict: dict) -> list[tuple[str, str]]:
+        # the (category, subcategory) matches of kw for the given parent categories
         matching_category = False
         for category in categories:
             if category in subcategories_dict.keys():
@@ -259,8 +491,10 @@ class Categorizer:
             return []
 
         kw = kw.lower()
-        kw_stripped = re.sub(r"[^a-zA-Z0-9]", "", unidecode(kw.lower()))
+        kw_stripped = strip_keyword(kw)
+        kw_tokens = keyword_tokens(kw)
         kw_synsets = self._get_synsets(kw)
+        similarity_stats = dict(self.similarity.stats)
 
         token_matches = set()
         part_matches = set()
@@ -276,26 +510,23 @@ class Categorizer:
                     try:
                         compare_kw_stripped = self.kw_kw_stripped[compare_kw]
                     except KeyError:
-                        compare_kw_stripped = re.sub(r"[^a-zA-Z0-9]", "", unidecode(compare_kw.lower()))
+                        compare_kw_stripped = strip_keyword(compare_kw)
                         self.kw_kw_stripped[compare_kw] = compare_kw_stripped
                     if kw_stripped == compare_kw_stripped:  # Direct match, return category
+                        self._record_comparisons("get_subcategory", similarity_stats)
                         return [(category, subcategory)]
 
                     if (category, subcategory) not in token_matches:
                         # Check if compare_kw is one of the tokens in kw
-                        kw_tokens = [re.sub(r"[^a-zA-Z0-9]", "", unidecode(s.lower())) for s in re.split(r"[\s\-_/#@\.,\(\)\[\]\|\&]", kw)]
-                        compare_stripped = re.sub(r"[^a-zA-Z0-9]", "", unidecode(compare_kw.lower()))
                         found_match = False
-                        for kw_token in kw_tokens:
-                            if kw_token == compare_stripped:  # compare_kw is a match for one of the tokens in kw.
-                                token_matches.add((category, subcategory))
-                                # print(f"Word match: {kw_token} ({kw}) -> {compare_kw} -> {subcategory}")
-                                found_match = True
-                                break
+                        if compare_kw_stripped in kw_tokens:  # compare_kw is a match for one of the tokens in kw.
+                            token_matches.add((category, subcategory))
+                            # print(f"Word match: {compare_kw_stripped} ({kw}) -> {compare_kw} -> {subcategory}")
+                            found_match = True
 
                         if not found_match and compare_synsets is not None and kw_synsets is not None:
                             # Only compare synsets if a synset could be found for at least 3/4 of the tokens in compare_kw.
-                            if len(compare_synsets) >= (len(word_tokenize(compare_kw)) * 0.75):
+                            if len(compare_synsets) >= (self._n_tokens(compare_kw) * 0.75):
                                 match_score = self._synsets_match(kw_synsets, compare_synsets)
                                 if match_score > 0:
                                     token_matches.add((category, subcategory))
@@ -306,5 +537,6 @@ class Categorizer:
                         part_matches.add((category, subcategory))
                         # print(f"Part match: {kw} -> {compare_kw} -> {subcategory}")
 
+        self._record_comparisons("get_subcategory", similarity_stats)
         matches = list(token_matches.union(part_matches))
         return matches
@@ -1,41 +1,314 @@
-import ast
+import argparse
 import json
+import sys
 import pandas as pd
+from multiprocessing import Pool
+from pathlib import Path
 from tqdm import tqdm
-from categorizer import Categorizer
+from categorizer import Categorizer, SIMILARITY_THRESH, nlp_version
+from similarity import SimilarityCache
 
-all_kws = set()
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "code"))
+from metrics import metrics
+from normalize import strip_keyword, strip_keywords
+from tables import parse_list
+from vocabulary import get_vocabulary
 
-extracted_df = pd.read_csv("../out/extracted.csv")
-kws_raw = extracted_df["cordis_keywords"].tolist() + extracted_df["euroscivoc_keywords"].tolist()
-kws_raw = [kw_lst for kw_lst in kws_raw if not pd.isna(kw_lst)]
-kws = list(set([val.lower().strip().replace("\"", "") for kw_lst in kws_raw for val in ast.literal_eval(kw_lst)]))
+SIMILARITY_CACHE_FILE = "similarity_cache.pkl"
+STATE_FILE = "kw_categorizations_state.json"  # the category entries kw_categorizations.csv was computed with
 
-kws_string = "count,kw\n"
 
-for kw in tqdm(kws):
-    if kw == "":
-        continue
+def _init_worker(subcategory_dict: dict, subsubcategory_dict: dict) -> None:
+    # every worker process builds its Categorizer once
+    global worker_categorizer, worker_subcategory_dict, worker_subsubcategory_dict
+    worker_categorizer = Categorizer(similarity_cache_file=SIMILARITY_CACHE_FILE)
+    worker_categorizer.similarity.track_new = True
+    worker_subcategory_dict = subcategory_dict
+    worker_subsubcategory_dict = subsubcategory_dict
+    metrics.pop()  # forked workers start with the metrics of the main process
 
-    kws_string += f"{kws.count(kw)},\"{kw}\"\n"
 
-with open("kw_categorizations.csv", "w+") as f:
-    f.write(kws_string)
-print("done writing keywords")
+def _categorize_shard(shard: list[tuple[int, str]]) -> tuple[list[tuple[int, list, list, list]], dict, dict]:
+    """
+    Categorize a shard of (index, kw), same as the serial pass. Also returns the
+    similarity scores computed for the shard, so the main process can save them, and its metrics.
+    """
+    worker_categorizer.get_synsets_batch([kw.lower() for _, kw in shard if isinstance(kw, str)])
+    results = []
+    for i, kw in shard:
+        results.append((i, *worker_categorizer.categorize(kw, worker_subcategory_dict, worker_subsubcategory_dict)))
+    count_similarity_stats(worker_categorizer.similarity)
+    return results, worker_categorizer.similarity.pop_new_scores(), metrics.pop()
 
-with open("subcategories.json", "r") as f:
-    subcategory_dict = json.load(f)
-with open("subsubcategories.json", "r") as f:
-    subsubcategory_dict = json.load(f)
 
-df = pd.read_csv("kw_categorizations.csv")
+def count_similarity_stats(similarity: SimilarityCache) -> None:
+    # add the similarity cache stats to the metrics and start them over
+    for key, value in similarity.stats.items():
+        metrics.count(f"similarity.{key}", value)
+    metrics.count("similarity.misses", similarity.stats["computed"] + similarity.stats["pruned"])
+    similarity.stats = {key: 0 for key in similarity.stats}
 
-c = Categorizer()
 
-tqdm.pandas(desc="Getting categories", leave=True, miniters=10)
-df["categories"] = df.progress_apply(lambda row: c.get_categories(row.kw), axis=1)
-tqdm.pandas(desc="Getting subcategories", leave=True, miniters=10)
-df["subcategories"] = df.progress_apply(lambda row: c.get_subcategory(row.kw, row.categories, subcategory_dict), axis=1)
-tqdm.pandas(desc="Getting subsubcategories", leave=True, miniters=10)
-df["subsubcategories"] = df.progress_apply(lambda row: c.get_subcategory(row.kw, row.subcategories, subsubcategory_dict), axis=1)
-df.to_csv("kw_categorizations.csv", index=False)
+def make_shards(kws: list[str], shard_size: int) -> list[list[tuple[int, str]]]:
+    """
+    Split kws in shards of about shard_size. Keywords that are the same once stripped share
+    a kw_cache entry, so the first one decides the categories of all of them: they are kept
+    in one shard, in their original order, to get the same results as a serial run.
+    """
+    groups = {}
+    keys = strip_keywords(pd.Series(kws, dtype=object))
+    for i, (kw, key) in enumerate(zip(kws, keys)):
+        groups.setdefault(key if isinstance(key, str) else None, []).append((i, kw))
+
+    shards = [[]]
+    for group in groups.values():
+        if len(shards[-1]) >= shard_size:
+            shards.append([])
+        shards[-1].extend(group)
+    return shards
+
+
+def categorize_parallel(kws: list[str], subcategory_dict: dict, subsubcategory_dict: dict, workers: int, shard_size: int) -> tuple[list[tuple[list, list, list]], dict]:
+    """
+    Categorize kws over a pool of worker processes, results are returned in the order of kws.
+    """
+    results = [None] * len(kws)
+    similarity_scores = {}
+    shards = make_shards(kws, shard_size)
+    with Pool(workers, initializer=_init_worker, initargs=(subcategory_dict, subsubcategory_dict)) as pool:
+        with tqdm(total=len(kws), desc="Getting (sub)categories", leave=True, miniters=10) as progress:
+            for shard_results, shard_scores, shard_metrics in pool.imap_unordered(_categorize_shard, shards):
+                for i, categories, subcategories, subsubcategories in shard_results:
+                    results[i] = (categories, subcategories, subsubcategories)
+                similarity_scores.update(shard_scores)
+                metrics.merge(shard_metrics)
+                progress.update(len(shard_results))
+    return results, similarity_scores
+
+
+def save_state(state_file: str, category_dict: dict, subcategory_dict: dict, subsubcategory_dict: dict) -> None:
+    state = {
+        "nlp": nlp_version(),
+        "categories": category_dict,
+        "subcategories": subcategory_dict,
+        "subsubcategories": subsubcategory_dict,
+    }
+    with open(state_file, "w") as f:
+        json.dump(state, f)
+
+
+def load_state(state_file: str) -> dict | None:
+    if not Path(state_file).exists():
+        return None
+    with open(state_file, "r") as f:
+        state = json.load(f)
+    if state.get("nlp") != nlp_version():
+        return None
+    return state
+
+
+def changed_entries(old_dict: dict, new_dict: dict, changed_kws: set[str] = set()) -> set[str]:
+    """
+    Keys that were added, removed or edited between old_dict and new_dict. (Sub)subcategory
+    entries also count as changed if one of their kws was added to or removed from
+    categories.json, as only the synsets of those kws are compared.
+    """
+    changed = set()
+    for key in old_dict.keys() | new_dict.keys():
+        new_entry = new_dict.get(key)
+        if old_dict.get(key) != new_entry:
+            changed.add(key)
+        elif isinstance(new_entry, dict) and any(kw in changed_kws for kws in new_entry.values() for kw in kws):
+            changed.add(key)
+    return changed
+
+
+def load_delta_mappings(state: dict | None, category_dict: dict, subcategory_dict: dict, subsubcategory_dict: dict) -> pd.DataFrame | None:
+    """
+    The mappings in kw_categorizations.csv, if they were computed with the current (sub)categories, else None.
+    """
+    if state is None or not Path("kw_categorizations.csv").exists():
+        return None
+    if (state["categories"], state["subcategories"], state["subsubcategories"]) != (category_dict, subcategory_dict, subsubcategory_dict):
+        return None
+    return pd.read_csv("kw_categorizations.csv").dropna(subset=["kw"]).drop_duplicates("kw", keep="last")
+
+
+def merge_mappings(vocabulary_df: pd.DataFrame, mapped_df: pd.DataFrame | None, new_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The mappings of every kw in vocabulary_df (count, kw), from new_df or mapped_df, in the order of vocabulary_df.
+    Kws no longer in the vocabulary are dropped, so the result is the same as categorizing all kws.
+    """
+    if mapped_df is None:
+        return new_df
+    mappings = pd.concat([mapped_df, new_df]).drop(columns=["count"]).drop_duplicates("kw", keep="last").set_index("kw")
+    return vocabulary_df.join(mappings, on="kw")
+
+
+def _parent_names(categories) -> set[str]:
+    # the keys get_subcategory looks up in the (sub)subcategories dict
+    categories = parse_list(categories)
+    if categories is None:
+        return set()
+    if isinstance(categories, str):
+        return {categories}
+    return {category[1] if isinstance(category, tuple) else category for category in categories}
+
+
+def recategorize_incremental(df: pd.DataFrame, c: Categorizer, state: dict, subcategory_dict: dict, subsubcategory_dict: dict) -> pd.Series:
+    """
+    Update the (sub)categories in df, computed with the entries in state, to the current entries.
+    A kw is only redone for the categories that changed; its subcategories only if its categories or the
+    subcategories of one of its categories changed, the same for the subsubcategories.
+    Returns which rows changed.
+
+    This is the same as keeping a fingerprint per kw of the entries its row depends on (all categories,
+    the subcategory entries of its categories, the subsubcategory entries of its subcategories) and redoing
+    the kws whose fingerprint changed: every write of kw_categorizations.csv saves the state, so all rows
+    were computed with the entries in state and the fingerprint of a kw follows from state and its parents.
+    Diffing the entries once gives the changed parents for all kws, and the categories are only matched
+    against the changed categories instead of all of them.
+    """
+    changed_categories = changed_entries(state["categories"], c.category_kws)
+    old_vocabulary = {kw for kws in state["categories"].values() for kw in kws}
+    changed_kws = old_vocabulary ^ set(c.kw_category.keys())
+    changed_subcategories = changed_entries(state["subcategories"], subcategory_dict, changed_kws)
+    changed_subsubcategories = changed_entries(state["subsubcategories"], subsubcategory_dict, changed_kws)
+    print(f"* Changed: {len(changed_categories)} categories, {len(changed_subcategories)} subcategory and {len(changed_subsubcategories)} subsubcategory entries")
+
+    # kws that are (or were) a category kw themselves come from the kw_cache, those are redone completely
+    stripped_vocabulary = {strip_keyword(kw) for kw in old_vocabulary | changed_kws}
+
+    changed_rows = pd.Series(False, index=df.index)
+    for col in ["categories", "subcategories", "subsubcategories"]:
+        df[col] = df[col].astype(object)
+
+    if len(changed_categories) > 0:
+        group_categories = {}  # {kw_stripped: categories}, kws that are the same once stripped get the categories of the first
+        for i, kw in tqdm(df["kw"].items(), total=len(df), desc="Updating categories", miniters=10):
+            if pd.isna(kw):
+                continue
+            kw_stripped = strip_keyword(kw)
+            old_categories = parse_list(df.at[i, "categories"])
+            if kw_stripped in stripped_vocabulary:
+                categories = c.get_categories(kw)
+            elif kw_stripped in group_categories:
+                categories = group_categories[kw_stripped]
+            else:
+                categories = [category for category in old_categories if category not in changed_categories]
+                categories += list(c.match_categories(kw, changed_categories))
+                group_categories[kw_stripped] = categories
+            if categories != old_categories:
+                df.at[i, "categories"] = categories
+                changed_rows[i] = True
+
+    for col, parent_col, subcategories_dict, changed_parents in [
+        ("subcategories", "categories", subcategory_dict, changed_subcategories),
+        ("subsubcategories", "subcategories", subsubcategory_dict, changed_subsubcategories),
+    ]:
+        redo = changed_rows.copy()
+        if len(changed_parents) > 0:
+            redo |= df[parent_col].map(lambda parents: len(_parent_names(parents) & changed_parents) > 0)
+        for i in tqdm(redo.index[redo], desc=f"Updating {col}", miniters=10):
+            kw = df.at[i, "kw"]
+            if pd.isna(kw):
+                continue
+            subcategories = c.get_subcategory(kw, parse_list(df.at[i, parent_col]), subcategories_dict)
+            if subcategories != parse_list(df.at[i, col]):
+                df.at[i, col] = subcategories
+                changed_rows[i] = True
+    return changed_rows
+
+
+if __name__ == "__main__":
+    default_extracted_file = "../out/extracted.csv"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--extractedfile", "-ef", nargs='?', const=default_extracted_file, default=default_extracted_file, type=str, help=".csv, .parquet or .feather")
+    parser.add_argument("--workers", "-w", default=1, type=int, help="number of processes to categorize with")
+    parser.add_argument("--shard-size", "-ss", default=200, type=int, help="keywords per task sent to a worker")
+    parser.add_argument("--incremental", "-i", action="store_true", help="only update kw_categorizations.csv for the changed (sub)categories")
+    parser.add_argument("--delta", "-d", action="store_true", help="only categorize the kws without a mapping in kw_categorizations.csv yet, e.g. those of the projects new in extract_keywords.py --delta")
+    args = parser.parse_args()
+
+    with open("./categories.json", "r") as f:
+        category_dict = json.load(f)
+    with open("subcategories.json", "r") as f:
+        subcategory_dict = json.load(f)
+    with open("subsubcategories.json", "r") as f:
+        subsubcategory_dict = json.load(f)
+
+    state = load_state(STATE_FILE) if args.incremental else None
+    if args.incremental and (state is None or not Path("kw_categorizations.csv").exists()):
+        print(f"No (up to date) {STATE_FILE}, categorizing all keywords")
+    if state is not None and Path("kw_categorizations.csv").exists():
+        with metrics.stage("init"):
+            c = Categorizer(similarity_cache_file=SIMILARITY_CACHE_FILE)
+        df = pd.read_csv("kw_categorizations.csv")
+        with metrics.stage("update"):
+            changed_rows = recategorize_incremental(df, c, state, subcategory_dict, subsubcategory_dict)
+        print(f"{changed_rows.sum()} keywords changed")
+        metrics.count("keywords", len(df))
+        metrics.count("keywords_changed", int(changed_rows.sum()))
+        with metrics.stage("write"):
+            df.to_csv("kw_categorizations.csv", index=False)
+            c.similarity.save()
+            c.save_snapshot()
+        count_similarity_stats(c.similarity)
+        save_state(STATE_FILE, category_dict, subcategory_dict, subsubcategory_dict)
+        metrics.save("get_keyword_mappings")
+        sys.exit(0)
+
+    # count is the number of projects with the kw
+    with metrics.stage("vocabulary"):
+        df = get_vocabulary(args.extractedfile).to_frame()
+    metrics.count("keywords", len(df))
+    vocabulary_df = df
+    mapped_df = load_delta_mappings(load_state(STATE_FILE), category_dict, subcategory_dict, subsubcategory_dict) if args.delta else None
+    if args.delta and mapped_df is None:
+        print(f"No kw_categorizations.csv of the current (sub)categories ({STATE_FILE}), categorizing all keywords")
+    if mapped_df is not None:
+        df = df.loc[~df["kw"].isin(mapped_df["kw"])].reset_index(drop=True)
+        print(f"{len(df)} new keywords, {len(vocabulary_df) - len(df)} already mapped")
+        metrics.count("keywords_new", len(df))
+        if len(df) == 0:
+            merge_mappings(vocabulary_df, mapped_df, df).to_csv("kw_categorizations.csv", index=False)  # the counts may have changed
+            metrics.save("get_keyword_mappings")
+            sys.exit(0)
+    else:
+        df.to_csv("kw_categorizations.csv", index=False)
+        print("done writing keywords")
+
+    if args.workers > 1:
+        with metrics.stage("init"):
+            Categorizer().save_snapshot()  # make sure the workers can start from an up to date snapshot
+        with metrics.stage("categorize"):
+            results, similarity_scores = categorize_parallel(df["kw"].tolist(), subcategory_dict, subsubcategory_dict, args.workers, args.shard_size)
+        df["categories"] = [categories for categories, _, _ in results]
+        df["subcategories"] = [subcategories for _, subcategories, _ in results]
+        df["subsubcategories"] = [subsubcategories for _, _, subsubcategories in results]
+        with metrics.stage("write"):
+            merge_mappings(vocabulary_df, mapped_df, df).to_csv("kw_categorizations.csv", index=False)
+
+            similarity = SimilarityCache(SIMILARITY_THRESH, cache_file=SIMILARITY_CACHE_FILE)
+            similarity.scores.update(similarity_scores)
+            similarity.save()
+    else:
+        with metrics.stage("init"):
+            c = Categorizer(similarity_cache_file=SIMILARITY_CACHE_FILE)
+        print("* Getting synsets of all keywords...")
+        with metrics.stage("synsets"):
+            c.get_synsets_batch(df["kw"].dropna().str.lower().tolist())
+
+        # category -> subcategory -> subsubcategory of every kw in one pass
+        with metrics.stage("categorize"):
+            results = [c.categorize(kw, subcategory_dict, subsubcategory_dict) for kw in tqdm(df["kw"], desc="Getting (sub)categories", leave=True, miniters=10)]
+        df["categories"] = [result.categories for result in results]
+        df["subcategories"] = [result.subcategories for result in results]
+        df["subsubcategories"] = [result.subsubcategories for result in results]
+        with metrics.stage("write"):
+            merge_mappings(vocabulary_df, mapped_df, df).to_csv("kw_categorizations.csv", index=False)
+            c.similarity.save()
+            c.save_snapshot()
+        count_similarity_stats(c.similarity)
+    save_state(STATE_FILE, category_dict, subcategory_dict, subsubcategory_dict)
+    metrics.save("get_keyword_mappings")
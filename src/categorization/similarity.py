@@ -0,0 +1,93 @@
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+from nltk.corpus.reader.wordnet import Synset
+
+CACHE_VERSION = 1
+_MISSING = object()
+
+
+class SimilarityCache:
+    """
+    Bounded LRU cache of Wu-Palmer similarities between synsets, keyed on synset names,
+    so the same pair is only computed once over all keywords. It can be saved to and loaded
+    from disk to carry over to the next run.
+
+    match_score only returns scores that can reach `threshold`: pairs whose depths make a
+    score of at least `threshold` impossible are pruned without calling wup_similarity.
+    """
+    def __init__(self, threshold: float, max_size: int = 2_000_000, cache_file: str | Path | None = None) -> None:
+        self.threshold = threshold
+        self.max_size = max_size
+        self.cache_file = cache_file
+        self.scores = OrderedDict()  # {(synset name, synset name): wup similarity or None}
+        self.depths = {}  # {synset name: (min depth, max depth)}
+        self.stats = {"hits": 0, "computed": 0, "pruned": 0}
+        self.track_new = False  # keep track of new pairs for pop_new_scores
+        self._new_keys = []
+        if cache_file is not None and Path(cache_file).exists():
+            self.load(cache_file)
+
+    def match_score(self, syn: Synset, other: Synset) -> float | None:
+        """
+        syn.wup_similarity(other), or None if that can't be at least the threshold.
+        """
+        key = (syn.name(), other.name())  # wup_similarity is not always symmetric (simulated roots), so ordered
+        score = self.scores.get(key, _MISSING)
+        if score is not _MISSING:
+            self.scores.move_to_end(key)
+            self.stats["hits"] += 1
+            return score
+
+        if self._wup_upper_bound(syn, other) < self.threshold:
+            self.stats["pruned"] += 1
+            return None
+
+        score = syn.wup_similarity(other)
+        self.stats["computed"] += 1
+        self.scores[key] = score
+        if self.track_new:
+            self._new_keys.append(key)
+        if len(self.scores) > self.max_size:
+            self.scores.popitem(last=False)
+        return score
+
+    def pop_new_scores(self) -> dict:
+        """
+        Scores computed since the last call (with track_new set), e.g. to merge the caches of worker processes.
+        """
+        new_scores = {key: self.scores[key] for key in self._new_keys if key in self.scores}
+        self._new_keys = []
+        return new_scores
+
+    def save(self, cache_file: str | Path | None = None) -> None:
+        cache_file = self.cache_file if cache_file is None else cache_file
+        with open(cache_file, "wb") as f:
+            pickle.dump({"version": CACHE_VERSION, "scores": dict(self.scores), "depths": self.depths}, f)
+
+    def load(self, cache_file: str | Path) -> None:
+        with open(cache_file, "rb") as f:
+            cached = pickle.load(f)
+        if cached.get("version") != CACHE_VERSION:
+            return
+        self.scores.update(cached["scores"])
+        self.depths.update(cached["depths"])
+
+    def _depth(self, syn: Synset) -> tuple[int, int]:
+        depth = self.depths.get(syn.name())
+        if depth is None:
+            depth = (syn.min_depth(), syn.max_depth())
+            self.depths[syn.name()] = depth
+        return depth
+
+    def _wup_upper_bound(self, syn: Synset, other: Synset) -> float:
+        """
+        wup = 2 * depth(lcs) / (len1 + len2), with len = distance to the lcs + depth(lcs).
+        The lcs is at most as deep as the shallowest of the two and a path to the lcs
+        can't be shorter than the min depth of the synset, that bounds the score from above.
+        All depths are taken one deeper, which keeps the bound safe for simulated (verb) roots.
+        """
+        min_depth, max_depth = self._depth(syn)
+        other_min_depth, other_max_depth = self._depth(other)
+        lcs_depth = min(max_depth, other_max_depth) + 2
+        return 2 * lcs_depth / (max(lcs_depth, min_depth + 2) + max(lcs_depth, other_min_depth + 2))
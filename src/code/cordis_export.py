@@ -0,0 +1,139 @@
+import io
+import json
+import warnings
+import zipfile
+from fnmatch import fnmatch
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Callable, Iterator, TextIO
+from metrics import metrics
+
+
+class CordisExport():
+    """
+    Keywords of the projects in a locally downloaded CORDIS bulk export, as an alternative to scraping
+    the project pages. Supported are the xml export (a .zip of one .xml file per project, or .xml files
+    with many <project> elements) and the json export (a .json array of projects or json lines, also in a .zip).
+    Of a .zip only the members matching one of the members patterns are read, the exports also hold other
+    tables (organization.json, webLink.json, ...) whose records have ids of their own.
+    Projects are read with streaming parsers, one at a time, in a single sequential read of the export:
+    only the id and keywords of every project are kept.
+    """
+    MEMBERS = ["project.*", "project-*"]  #project.json of the json export, project-rcn-<rcn>_<lang>.xml of the xml export
+
+    def __init__(self, export_file: str | Path, split_keywords: Callable[[str], list[str]], id_field: str = "id", keywords_field: str = "keywords", members: list[str] = MEMBERS):
+        self.export_file = Path(export_file)
+        self.members = members                #file name patterns of the project files in a .zip
+        self.split_keywords = split_keywords  #content of the keywords field -> keywords, like the keywords <meta> tag
+        self.id_field = id_field
+        self.keywords_field = keywords_field
+        self._keywords = None                 #{project id: keywords content or None}, read on first use
+
+    def get_keywords(self, project_ids: list[str]) -> list[list[str] | str]:
+        """
+        The keywords of every project in project_ids, "NOT FOUND" for projects without keywords in the export.
+        Same output as KeywordExtractor.scrape_keywords.
+        """
+        if self._keywords is None:
+            print(f"Reading keywords from {self.export_file} ...")
+            with metrics.stage("read_export"):
+                self._keywords = {}
+                for project_id, content in self.iter_projects():
+                    # a project listed twice keeps its keywords if one of the records has them
+                    if content is not None or project_id not in self._keywords:
+                        self._keywords[project_id] = content
+            metrics.count("export.projects", len(self._keywords))
+        results = []
+        missing = 0
+        for project_id in project_ids:
+            content = self._keywords.get(str(project_id))
+            if content is None:
+                missing += 1
+                results.append("NOT FOUND")
+            else:
+                results.append(self.split_keywords(content))
+        metrics.count("export.not_found", missing)
+        if missing > 0:
+            warnings.warn(f"{missing} projects have no keywords in {self.export_file}.", Warning)
+        return results
+
+    def iter_projects(self) -> Iterator[tuple[str, str | None]]:
+        """
+        (project id, keywords content) of every project in the export, in file order.
+        """
+        if self.export_file.suffix.lower() == ".zip":
+            with zipfile.ZipFile(self.export_file) as archive:
+                for name in sorted(archive.namelist()):
+                    fmt = Path(name).suffix.lower()
+                    if fmt not in (".xml", ".json", ".jsonl") or not any(fnmatch(Path(name).name.lower(), pattern) for pattern in self.members):
+                        continue
+                    with archive.open(name) as f:
+                        yield from self._iter_file(f, fmt)
+        else:
+            with open(self.export_file, "rb") as f:
+                yield from self._iter_file(f, self.export_file.suffix.lower())
+
+    #-- helper functions
+    def _iter_file(self, f, fmt: str) -> Iterator[tuple[str, str | None]]:
+        if fmt == ".xml":
+            yield from self._iter_xml(f)
+        elif fmt in (".json", ".jsonl"):
+            for project in self._iter_json(io.TextIOWrapper(f, encoding="utf-8")):
+                if isinstance(project, dict) and self.id_field in project:
+                    yield str(project[self.id_field]), self._keywords_content(project.get(self.keywords_field))
+        else:
+            raise ValueError(f"Unknown CORDIS export format {fmt}, expected .zip, .xml, .json or .jsonl")
+
+    def _iter_xml(self, f) -> Iterator[tuple[str, str | None]]:
+        # only outermost <project> elements are projects, <project> elements inside them are related projects
+        depth = 0
+        root = None
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            tag = elem.tag.rsplit("}", 1)[-1]  #without namespace
+            if root is None:
+                root = elem
+            if tag != "project":
+                continue
+            if event == "start":
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth > 0:
+                continue
+            fields = {child.tag.rsplit("}", 1)[-1]: child.text for child in elem}
+            if fields.get(self.id_field) is not None:
+                yield fields[self.id_field].strip(), self._keywords_content(fields.get(self.keywords_field))
+            # drop the parsed projects, so the tree doesn't grow with the file
+            elem.clear()
+            if root is not elem:
+                root.clear()
+
+    def _iter_json(self, f: TextIO, chunk_size: int = 1 << 20) -> Iterator[object]:
+        # the elements of a top level array or json lines, decoded one at a time from a sliding buffer
+        decoder = json.JSONDecoder()
+        buffer, pos = "", 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+                pos += 1
+            if pos == len(buffer):
+                buffer, pos = f.read(chunk_size), 0
+                if buffer == "":
+                    return
+                continue
+            try:
+                obj, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                chunk = f.read(chunk_size)
+                if chunk == "":  #a truncated or invalid file
+                    raise
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield obj
+
+    def _keywords_content(self, keywords: str | list | None) -> str | None:
+        if isinstance(keywords, list):
+            keywords = ",".join(str(kw) for kw in keywords)
+        if keywords is None or keywords.strip() == "":
+            return None
+        return keywords
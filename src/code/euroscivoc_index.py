@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+
+class EuroSciVocIndex():
+    """
+    The euroSciVoc keywords of every project in an sqlite database on disk, keyed on project ID,
+    so the keywords of a chunk of projects can be looked up without keeping euroSciVoc.csv in memory.
+
+    Built in one chunked pass over the csv, rebuilt when the csv changed (size or modification time).
+    Keywords keep the order of the csv, like a groupby("projectID") on the whole file.
+    """
+    def __init__(self, index_file: str | Path):
+        self.index_file = Path(index_file)
+        self.connection = sqlite3.connect(self.index_file)
+
+    @classmethod
+    def build(cls, csv_file: str | Path, index_file: str | Path, chunksize: int = 100_000) -> "EuroSciVocIndex":
+        """
+        The index of csv_file, the one in index_file if it was built from the current version of the csv.
+        """
+        csv_file, index_file = Path(csv_file), Path(index_file)
+        stat = csv_file.stat()
+        source_stamp = f"{csv_file.name} {stat.st_size} {stat.st_mtime_ns}"
+        if index_file.exists():
+            index = cls(index_file)
+            if index._source_stamp() == source_stamp:
+                return index
+            index.close()
+
+        print(f"Indexing euroSciVoc keywords of {csv_file} ...")
+        index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = index_file.with_name(f"{index_file.name}.{os.getpid()}.tmp")
+        tmp_file.unlink(missing_ok=True)
+        connection = sqlite3.connect(tmp_file)
+        connection.execute("CREATE TABLE keywords (project_id, title)")  #no types, ids keep the type of the csv
+        connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        for chunk in pd.read_csv(csv_file, usecols=["projectID", "euroSciVocTitle"], chunksize=chunksize):
+            chunk = chunk.dropna(subset=["projectID"]).astype(object)
+            chunk = chunk.where(chunk.notna(), None)
+            connection.executemany("INSERT INTO keywords VALUES (?, ?)", zip(chunk["projectID"], chunk["euroSciVocTitle"]))
+        connection.execute("CREATE INDEX keywords_project_id ON keywords (project_id)")
+        connection.execute("INSERT INTO meta VALUES ('source_stamp', ?)", (source_stamp,))
+        connection.commit()
+        connection.close()
+        os.replace(tmp_file, index_file)
+        return cls(index_file)
+
+    def lookup(self, project_ids: pd.Series, batch_size: int = 500) -> pd.Series:
+        """
+        The list of euroSciVoc keywords of every project in project_ids, NaN for projects without any.
+        """
+        ids = list(dict.fromkeys(project_ids.tolist()))
+        keywords = {}
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            rows = self.connection.execute(
+                f"SELECT project_id, title FROM keywords WHERE project_id IN ({', '.join('?' * len(batch))}) ORDER BY rowid", batch
+            )
+            for project_id, title in rows:
+                keywords.setdefault(project_id, []).append(np.nan if title is None else title)
+        return pd.Series([keywords.get(project_id, np.nan) for project_id in project_ids.tolist()], index=project_ids.index, dtype=object)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _source_stamp(self) -> str | None:
+        try:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'source_stamp'").fetchone()
+        except sqlite3.DatabaseError:  #not (yet) an index
+            return None
+        return row[0] if row is not None else None
@@ -1,11 +1,14 @@
 #imports
 import argparse
 import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 from tqdm import tqdm
-import logging #TODO, setup loggin? not set up yet
 #suggested libs:
 #use this for warnings, so we know when conditions are not met
 import warnings
@@ -14,71 +17,290 @@ from urllib.parse import urlparse, urljoin
 from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 from pathlib import Path
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+from cordis_export import CordisExport
+from euroscivoc_index import EuroSciVocIndex
+from page_cache import PageCache
+from tables import read_table, table_format, write_table
+
+class RateLimiter():
+    """
+    Spaces out requests per host, so at most `rate` requests per second are started for a host.
+    Shared by all scraping threads, a rate of None disables the limit.
+    """
+    def __init__(self, rate: float | None = None):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_slot = {}  # {host: earliest start time of the next request}
+
+    def wait(self, host: str) -> None:
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+class _StopParsing(Exception):
+    pass
+
+class KeywordTagParser(HTMLParser):
+    """
+    Streaming parser that stops at the first <tag name="keyword_attr" ...>, instead of
+    building the whole document tree. Uses the same tokenizer as BeautifulSoup's "html.parser".
+    """
+    def __init__(self, tag: str = "meta", keyword_attr: str = "keywords"):
+        super().__init__(convert_charrefs=True)
+        self.tag = tag
+        self.keyword_attr = keyword_attr
+        self.tag_attrs = None  #attributes of the matching tag, None if not found (yet)
+
+    def handle_starttag(self, tag, attrs):
+        if tag != self.tag:
+            return
+        #valueless attributes are "" in BeautifulSoup, last duplicate wins
+        attrs = {name: "" if value is None else value for name, value in attrs}
+        if attrs.get("name") == self.keyword_attr:
+            self.tag_attrs = attrs
+            raise _StopParsing()
 
 #setup class
 class KeywordExtractor():	
-    def __init__(self, keyword_attr : str = "keywords", tag : str = "meta"):
+    def __init__(self, 
+                 keyword_attr : str = "keywords", 
+                 tag : str = "meta", 
+                 workers : int = 1, 
+                 rate_limit : float | None = None,
+                 cache : PageCache | None = None,
+                 base_url : str | None = None):
         self.BASE_CORDIS_URL = "https://cordis.europa.eu/project/id/"
+        self.base_url = base_url if base_url is not None else self.BASE_CORDIS_URL #e.g. a local stand-in for CORDIS
         self.keyword_attr = keyword_attr #attr page with keyword
         self.tag = tag                   #tag with keywords
+        self.workers = workers           #number of concurrent requests
+        self.rate_limiter = RateLimiter(rate_limit) #max requests per second per host
+        self._sessions = {}              #{(retries, backoff): session}, shared by all threads
+        self._session_lock = threading.Lock()
+        self.cache = cache               #local page cache, None: always scrape
+        self.retries = 3                 #retries of a request on errors and 429/5xx responses
+        self.backoff = 2                 #backoff factor between retries
+        self.timeout = 10                #seconds
         
     def scrape_url(self, 
                     project_id: str,
                     base_url :str = None,
-                    retries: int = 3,
-                    backoff: float = 2,
-                    timeout: float = 10) -> list[str] | str:
+                    retries: int | None = None,
+                    backoff: float | None = None,
+                    timeout: float | None = None) -> str:
+        """
+        The html of the CORDIS page of project_id, "ERROR" if the request failed.
+        Pages in the cache are returned without a request while fresh, stale ones are revalidated
+        with their ETag/Last-Modified. Requests are rate limited per host and retried on errors and
+        429/5xx responses with the pooled session of (retries, backoff). Called from the worker
+        threads of scrape_keywords.
         """
-        TODO
-        """ 
+        #request setup of the extractor, unless given
+        retries = self.retries if retries is None else retries
+        backoff = self.backoff if backoff is None else backoff
+        timeout = self.timeout if timeout is None else timeout
         #url of cordis project page
         if base_url is None:
-            url = urljoin(self.BASE_CORDIS_URL, str(project_id))
+            url = urljoin(self.base_url, str(project_id))
         else:
-            url = urljoin(base_url, project_id)
+            url = urljoin(base_url, str(project_id))
         
-        # source original setup: https://oxylabs.io/blog/python-requests-retry 
-        retry_setup = Retry(
-            total=retries,
-            backoff_factor=backoff, #{backoff factor} * (2 ** ({number of previous retries}))
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
-        adapter = HTTPAdapter(max_retries=retry_setup)
-        session = requests.Session()
-        session.mount('https://', adapter)
+        #serve from the cache if possible, stale entries are revalidated with their ETag/Last-Modified
+        headers = {}
+        cached_html_txt = None
+        if self.cache is not None:
+            meta = self.cache.get(project_id)
+            if meta is not None:
+                cached_html_txt = self.cache.get_html(project_id)
+            if cached_html_txt is not None:
+                if self.cache.is_fresh(meta):
+                    metrics.count("page_cache.hits")
+                    self.project_id = project_id
+                    return cached_html_txt
+                if meta.get("etag"):
+                    headers["If-None-Match"] = meta["etag"]
+                if meta.get("last_modified"):
+                    headers["If-Modified-Since"] = meta["last_modified"]
+
+        if self.cache is not None:
+            metrics.count("page_cache.misses")
+        session = self._get_session(retries, backoff)
+        self.rate_limiter.wait(urlparse(url).netloc)
+        r = None
+        start = time.perf_counter()
         try:
-            r = session.get(url, timeout=timeout)
+            r = session.get(url, timeout=timeout, headers=headers)
             r.raise_for_status()  
         except requests.exceptions.RequestException as e:
+            self._record_request(r, time.perf_counter() - start, e, retries)
             warnings.warn(f"Request failed: {e}", Warning)
             return "ERROR"
+        self._record_request(r, time.perf_counter() - start)
         
-        cordis_html_txt = r.text
         self.project_id = project_id
+        if r.status_code == 304 and cached_html_txt is not None:
+            metrics.count("page_cache.revalidated")
+            self.cache.touch(project_id)
+            return cached_html_txt
+
+        cordis_html_txt = r.text
+        if self.cache is not None:
+            self.cache.put(project_id, cordis_html_txt, url=url, 
+                           etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"))
         return cordis_html_txt
     
+    def scrape_keywords(self, project_ids: list[str], leave: bool = True) -> list[list[str] | str]:
+        """
+        Scrape the keywords of all projects in project_ids, with self.workers requests in flight.
+        Results are returned in the order of project_ids, so the output is the same as a serial run.
+        """
+        progress = dict(total=len(project_ids), desc="Retrieving keywords from CORDIS", leave=leave, miniters=1)
+        if self.workers <= 1:
+            return [self._get_cordis_keywords_scrape(project_id) for project_id in tqdm(project_ids, **progress)]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(tqdm(executor.map(self._get_cordis_keywords_scrape, project_ids), **progress))
+
     def parse_keywords_from_html(self, 
                                  html_txt: str,
-                                 attrs: str = "keywords") -> list[str] | str:
+                                 attrs: str = "keywords",
+                                 project_id: str = None) -> list[str] | str:
         """
         -explain what cordis is
         -explain what the function does
         -explain variables
         -explain return 
         """
+        #find content of tag with keywords, <meta name="keywords" content=.... 
+        #stream the page up to the tag, fall back to a full parse if that fails
+        content = self._find_keywords_content_fast(html_txt)
+        if content is None:
+            content = self._find_keywords_content_full(html_txt)
+        if content is None:
+            if project_id is None:
+                project_id = getattr(self, "project_id", None)
+            warnings.warn(f"Could not find keywords for project {project_id}.", Warning)
+            return "NOT FOUND"
+
+        return self.split_keywords(content)
+
+    def split_keywords(self, content: str) -> list[str]:
+        #comma separated keywords, without the HORIZON call identifiers CORDIS adds
+        keywords = set([kw.strip() for kw in content.split(",") if (kw != "" and not kw.startswith("HORIZON"))])
+        return list(keywords)
+
+    def _find_keywords_content_fast(self, html_txt: str, chunk_size: int = 16384) -> str | None:
+        parser = KeywordTagParser(self.tag, self.keyword_attr)
+        try:
+            for start in range(0, len(html_txt), chunk_size):
+                parser.feed(html_txt[start:start + chunk_size])
+            parser.close()
+        except _StopParsing:
+            pass
+        except Exception:  #leave odd markup to BeautifulSoup
+            return None
+        if parser.tag_attrs is None:
+            return None
+        return parser.tag_attrs.get("content")
+
+    def _find_keywords_content_full(self, html_txt: str) -> str | None:
         #parse html with BeautifulSoup
         soup = BeautifulSoup(html_txt, "html.parser")
-        
-        #find tag with keywords, <meta name="keywords" .... 
         keywords_soup = soup.find(self.tag, attrs={"name": self.keyword_attr})
         if keywords_soup is None:
-            warnings.warn(f"Could not find keywords for project {self.project_id}.", Warning)
-            return "NOT FOUND"
+            return None
+        return keywords_soup["content"]
 
-        keywords = set([kw.strip() for kw in keywords_soup["content"].split(",") if (kw != "" and not kw.startswith("HORIZON"))])
-        return list(keywords)
+    def _get_cordis_keywords_scrape(self, project_id: str) -> list[str] | str:
+        #keywords parsed in an earlier run, with the same tag/attr setup, don't need a parse or request
+        if self.cache is not None:
+            meta = self.cache.get(project_id)
+            if (meta is not None and self.cache.is_fresh(meta) 
+                    and "keywords" in meta and meta.get("parser") == self._parser_key()):
+                metrics.count("keyword_cache.hits")
+                return meta["keywords"]
+            metrics.count("keyword_cache.misses")
+
+        html_txt = self.scrape_url(project_id)
+        if html_txt == "ERROR":
+            return "ERROR"
+        else:
+            keywords = self.parse_keywords_from_html(html_txt, project_id=project_id)
+            if self.cache is not None:
+                #pages without keywords ("NOT FOUND") are retried, those go back to CORDIS
+                if isinstance(keywords, list):
+                    self.cache.put_keywords(project_id, keywords, self._parser_key())
+                else:
+                    self.cache.expire(project_id)
+            return keywords
+
+    def _record_request(self, 
+                        r: requests.Response | None, 
+                        seconds: float, 
+                        error: requests.exceptions.RequestException | None = None, 
+                        retries: int = 0) -> None:
+        # latency including retries and backoff, the status of the final response and of every retried attempt
+        metrics.count("http.requests")
+        metrics.observe("http.latency_seconds", seconds)
+        if error is not None:
+            metrics.count("http.failed")
+        if isinstance(error, requests.exceptions.RetryError):  # retries ran out, no response to get the history from
+            metrics.count("http.retries", retries)
+            metrics.count("http.retries_exhausted")
+        if r is None:
+            return
+        metrics.count(f"http.status.{r.status_code}")
+        retry_state = getattr(r.raw, "retries", None)
+        history = retry_state.history if retry_state is not None else ()
+        metrics.count("http.retries", len(history))
+        for attempt in history:
+            metrics.count(f"http.retried_status.{attempt.status if attempt.status is not None else 'error'}")
+
+    def _parser_key(self) -> str:
+        return f"{self.tag}[name={self.keyword_attr}]"
+
+    def _get_session(self, retries: int, backoff: float) -> requests.Session:
+        # one pooled session per retry setup, so connections are reused across requests and threads
+        with self._session_lock:
+            session = self._sessions.get((retries, backoff))
+            if session is None:
+                # source original setup: https://oxylabs.io/blog/python-requests-retry 
+                retry_setup = Retry(
+                    total=retries,
+                    backoff_factor=backoff, #{backoff factor} * (2 ** ({number of previous retries}))
+                    status_forcelist=[429, 500, 502, 503, 504],
+                )
+                pool_size = max(self.workers, 10)
+                adapter = HTTPAdapter(max_retries=retry_setup, pool_connections=pool_size, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[(retries, backoff)] = session
+        return session
 
 class KeywordExtractorEU(KeywordExtractor):
+    #project.csv columns not needed for the analysis, never read
+    DROPPED_PROJECT_COLUMNS = [
+        "acronym", "status", "title", "startDate", "endDate", "totalCost",
+        "legalBasis", "ecSignatureDate", "frameworkProgramme",
+        "masterCall", "subCall", "fundingScheme", "nature", "objective",
+        "contentUpdateDate", "rcn", "grantDoi"
+    ]
+    #(prefix, regex) per topic format, the group is the cluster part, see _get_cluster
+    CLUSTER_PATTERNS = [
+        ("HORIZON", r"^HORIZON[^-]*-([^-]*)"),
+        ("ERC", r"^ERC[^-]*-[^-]*-([^-]*)"),
+        ("EURATOM", r"^EURATOM[^-]*-[^-]*-(.*)-[^-]*$"),
+    ]
+
     def __init__(self, keyword_attr = "keywords", tag = "meta", cli=True):
         super().__init__(keyword_attr, tag)
         #setup proj dirs
@@ -88,13 +310,33 @@ class KeywordExtractorEU(KeywordExtractor):
         #def csv file locations
         self.default_project_file = self.DATA_DIR / 'project.csv'
         self.default_euroscivoc_file = self.DATA_DIR / 'euroscivoc.csv'
+        self.default_cache_dir = self.OUT_DIR / 'cache'
+        self.default_export_file = self.DATA_DIR / 'cordis-HORIZONprojects-xml.zip'
+        self.default_euroscivoc_index = self.OUT_DIR / 'euroscivoc_index.sqlite'
+        self.default_out_file = self.OUT_DIR / 'extracted.csv'
+        self.default_delta_state = self.OUT_DIR / 'delta_state.csv'
+        self.default_delta_ids = self.OUT_DIR / 'delta_ids.csv'
         # parse command line arguments if cli, setup clusters
         if cli:
             self._setup_cli_parser()
             self.clusters = self._cliparse_clusters()    
         else:
-            #TODO
+            #defaults of the command line options, e.g. when used from another script
             self._setup_args()
+            self.clusters = self.args.clusters
+        self.workers = self.args.workers
+        self.rate_limiter = RateLimiter(self.args.rate_limit)
+        self.base_url = self.args.base_url if self.args.base_url is not None else self.BASE_CORDIS_URL
+        self.retries = self.args.retries
+        self.backoff = self.args.backoff
+        self.timeout = self.args.timeout
+        if self.args.cache_dir is not None:
+            self.cache = PageCache(
+                self.args.cache_dir,
+                ttl=self.args.cache_ttl * 3600 if self.args.cache_ttl is not None else None,
+                max_size=int(self.args.cache_max_size * 1024**2) if self.args.cache_max_size is not None else None,
+            )
+        self.export = CordisExport(self.args.export_file, self.split_keywords, members=self.args.export_members) if self.args.source == "export" else None
         
     def process_csv_files(self) -> pd.DataFrame:
         """
@@ -102,50 +344,231 @@ class KeywordExtractorEU(KeywordExtractor):
         -explain what the function does
         """
 
-        #read project file, drop columns not needed, convert numbers to floats and filter clusters
-        project_df = pd.read_csv(self.args.projectfile)
-        project_df = project_df.drop(columns=[
-            "acronym", "status", "title", "startDate", "endDate", "totalCost",
-            "legalBasis", "ecSignatureDate", "frameworkProgramme",
-            "masterCall", "subCall", "fundingScheme", "nature", "objective",
-            "contentUpdateDate", "rcn", "grantDoi"
-        ])
-        project_df["ecMaxContribution"] = project_df["ecMaxContribution"].apply(lambda val: self._convert_to_float(val))
-        project_df["cluster"] = project_df["topics"].apply(lambda topic: self._get_cluster(topic))
-        if self.clusters != "all":
-            project_df = project_df.loc[project_df.cluster.isin(self.clusters)]
+        #read project file without the columns not needed, convert numbers to floats and filter clusters
+        project_df = self._prepare_projects(pd.read_csv(
+            self.args.projectfile,
+            usecols=lambda col: col not in self._dropped_columns(),
+            dtype={"ecMaxContribution": str, "topics": "category"},
+        ))
 
         # process euro scientific vocab file, add keywords to proj df
         print("Getting euroSciVoc keywords...")
-        euroscivoc_df = pd.read_csv(self.args.euroscivocfile)
+        euroscivoc_df = pd.read_csv(self.args.euroscivocfile, usecols=["projectID", "euroSciVocTitle"])
         euroscivoc_keywords = euroscivoc_df.groupby("projectID")["euroSciVocTitle"].apply(list).reset_index(name="euroscivoc_keywords")
         project_df = project_df.merge(euroscivoc_keywords, how="left", left_on="id", right_on="projectID").drop(columns=["projectID"])
         return project_df
 
+    def process_csv_chunks(self, euroscivoc_index: EuroSciVocIndex) -> Iterator[pd.DataFrame]:
+        """
+        Same as process_csv_files, for --chunk-size projects at a time, with the euroSciVoc keywords
+        looked up in euroscivoc_index instead of merged from the whole file.
+        """
+        chunks = pd.read_csv(
+            self.args.projectfile,
+            usecols=lambda col: col not in self._dropped_columns(),
+            dtype={"ecMaxContribution": str, "topics": "category"},
+            chunksize=self.args.chunk_size,
+        )
+        for chunk in chunks:
+            with metrics.stage("read_csv"):
+                chunk = self._prepare_projects(chunk)
+                chunk["euroscivoc_keywords"] = euroscivoc_index.lookup(chunk["id"])
+            yield chunk
+
+    def get_keywords(self, project_ids: list[str], leave: bool = True) -> list[list[str] | str]:
+        """
+        The CORDIS keywords of all projects in project_ids from the --source backend: scraped from
+        the project pages, or read from a local bulk export (--export-file, see CordisExport).
+        """
+        if self.export is not None:
+            return self.export.get_keywords(project_ids)
+        return self.scrape_keywords(project_ids, leave=leave)
+
     def get_cordis_keywords(self, project_df: pd.DataFrame, save = True) -> list[str] | str:
-        tqdm.pandas(desc="Retrieving keywords from CORDIS", leave=True, miniters=1)
-        project_df["cordis_keywords"] = project_df.progress_apply(lambda row: self._get_cordis_keywords_scrape(row.id), axis=1)
+        project_df["cordis_keywords"] = self.get_keywords(project_df["id"].tolist())
         
         if save:
-            out_file = "./out/extracted.csv"
-            print(f"Writing to {out_file} ...")
-            try:
-                os.makedirs("./out", exist_ok=True)
-                project_df.to_csv(out_file, index=False)
-            except FileExistsError:
-                pass
+            self._write_out_file(project_df)
             
         return project_df    
-    
-    def _get_cordis_keywords_scrape(self, project_id: str) -> list[str] | str:
-        html_txt = self.scrape_url(project_id)
-        if html_txt == "ERROR":
-            return "ERROR"
+
+    def get_cordis_keywords_delta(self, project_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Same as get_cordis_keywords, for a new download of the project file. Only projects that are new,
+        have another contentUpdateDate than in --delta-state (written by the previous --delta run) or have
+        no keywords in the out file because their request failed ("ERROR") are scraped, the others keep their
+        CORDIS keywords from the out file. "NOT FOUND" projects are only scraped again once their
+        contentUpdateDate changes. Without --delta-state (the first --delta run) the projects in an existing
+        out file count as unchanged. Projects no longer in the project file are dropped. The ids of the
+        projects whose keywords may have changed are written to --delta-ids, for categorize.py --delta.
+        """
+        out_file = Path(self.args.outfile)
+        state_file = Path(self.args.delta_state)
+        update_dates = project_df.pop("contentUpdateDate").fillna("").astype(str)
+        ids = project_df["id"]
+
+        if out_file.exists():
+            previous_df = read_table(out_file).drop_duplicates("id", keep="last").set_index("id")
+            if state_file.exists():
+                previous_dates = pd.read_csv(state_file, dtype={"contentUpdateDate": str}, keep_default_na=False)
+                previous_dates = previous_dates.drop_duplicates("id", keep="last").set_index("id")["contentUpdateDate"]
+            else:
+                print(f"No {state_file}, taking the projects in {out_file} as up to date")
+                previous_dates = pd.Series(update_dates.to_numpy(), index=ids.to_numpy())
+                previous_dates = previous_dates.loc[previous_dates.index.isin(previous_df.index) & ~previous_dates.index.duplicated(keep="last")]
+            old_keywords = ids.map(previous_df["cordis_keywords"])
+            todo = (ids.map(previous_dates) != update_dates) | ~old_keywords.map(lambda kws: isinstance(kws, list) or kws == "NOT FOUND")
+            removed = len(previous_df.index.difference(ids))
+            print(f"{todo.sum()} new or updated projects, {len(ids) - todo.sum()} unchanged, {removed} removed")
         else:
-            keywords = self.parse_keywords_from_html(html_txt)
-            return keywords
+            print(f"No previous run in {out_file}, getting the keywords of all projects")
+            previous_df = None
+            old_keywords = pd.Series(None, index=ids.index, dtype=object)
+            todo = pd.Series(True, index=ids.index)
+        metrics.count("delta.todo", int(todo.sum()))
+
+        keywords = old_keywords.tolist()
+        for pos, kws in zip(np.flatnonzero(todo.to_numpy()), self.get_keywords(ids.loc[todo].tolist())):
+            keywords[pos] = kws
+        project_df["cordis_keywords"] = keywords
+
+        # the euroSciVoc keywords come from the new download, projects where they changed are recategorized as well
+        changed = todo.copy()
+        if previous_df is not None and "euroscivoc_keywords" in previous_df.columns:
+            as_list = lambda kws: kws if isinstance(kws, list) else None
+            changed |= pd.Series([as_list(old) != as_list(new) for old, new in zip(ids.map(previous_df["euroscivoc_keywords"]), project_df["euroscivoc_keywords"])], index=ids.index)
+        metrics.count("delta.changed", int(changed.sum()))
+
+        self._write_out_file(project_df)
+        pd.DataFrame({"id": ids, "contentUpdateDate": update_dates}).to_csv(state_file, index=False)
+        pd.DataFrame({"id": ids.loc[changed]}).to_csv(self.args.delta_ids, index=False)
+        print(f"{changed.sum()} changed projects written to {self.args.delta_ids}")
+        return project_df
+
+    def get_cordis_keywords_checkpointed(self, project_df: pd.DataFrame) -> Path:
+        """
+        Same as get_cordis_keywords, but scrapes in batches of --batch-size projects and appends
+        every batch to the out file, so only one batch is kept in memory. When restarted, projects
+        already in the out file are skipped, except those marked "ERROR" or "NOT FOUND", which are
+        retried. Once all projects are done, the out file is compacted to one row per project.
+        Columnar out files can't be appended to, for those the batches go to a .checkpoint.csv
+        file next to it, which is converted and removed once all projects are done.
+        """
+        out_file, columnar_file = self._checkpoint_files()
+        done_ids = self._read_done_ids(out_file, list(project_df.columns) + ["cordis_keywords"])
+        todo_df = project_df.loc[~project_df["id"].isin(done_ids)]
+        print(f"{len(project_df) - len(todo_df)} projects already in {out_file}, {len(todo_df)} to go...")
+
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+        with tqdm(total=len(todo_df), desc="Checkpointed batches", leave=True) as progress:
+            self._scrape_batches(todo_df, out_file, progress)
+        return self._finish_checkpoint(out_file, columnar_file)
+
+    def get_cordis_keywords_streamed(self) -> Path:
+        """
+        Same as get_cordis_keywords_checkpointed, but the project file is read --chunk-size projects at
+        a time and every chunk is filtered, joined with its euroSciVoc keywords (from an index on disk,
+        see EuroSciVocIndex), scraped and appended before the next one is read. Memory stays flat
+        however large the input files are, as long as the out file is a csv: a columnar out file is
+        converted from the .checkpoint.csv as a whole at the end, which is then removed.
+        """
+        with metrics.stage("index"):
+            euroscivoc_index = EuroSciVocIndex.build(self.args.euroscivocfile, self.args.euroscivoc_index)
+        out_file, columnar_file = self._checkpoint_files()
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+        done_ids = None
+        with tqdm(desc="Streamed projects", leave=True) as progress:
+            for chunk in self.process_csv_chunks(euroscivoc_index):
+                if done_ids is None:
+                    done_ids = self._read_done_ids(out_file, list(chunk.columns) + ["cordis_keywords"])
+                    if len(done_ids) > 0:
+                        print(f"{len(done_ids)} projects already in {out_file}")
+                metrics.count("projects", len(chunk))
+                todo_df = chunk.loc[~chunk["id"].isin(done_ids)]
+                progress.update(len(chunk) - len(todo_df))
+                with metrics.stage("scrape"):
+                    self._scrape_batches(todo_df, out_file, progress)
+        euroscivoc_index.close()
+        return self._finish_checkpoint(out_file, columnar_file)
 
     #-- helper functions
+    def _dropped_columns(self) -> list[str]:
+        #--delta compares the contentUpdateDate, it is taken out again before the results are written
+        if self.args.delta:
+            return [col for col in self.DROPPED_PROJECT_COLUMNS if col != "contentUpdateDate"]
+        return self.DROPPED_PROJECT_COLUMNS
+
+    def _write_out_file(self, project_df: pd.DataFrame) -> None:
+        out_file = Path(self.args.outfile)
+        print(f"Writing to {out_file} ...")
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+        with metrics.stage("write"):
+            write_table(project_df, out_file)
+
+    def _prepare_projects(self, project_df: pd.DataFrame) -> pd.DataFrame:
+        #convert numbers to floats, add the clusters and filter them
+        project_df["ecMaxContribution"] = self._convert_to_float_series(project_df["ecMaxContribution"])
+        project_df["cluster"] = self._get_cluster_series(project_df["topics"])
+        if self.clusters != "all":
+            project_df = project_df.loc[project_df.cluster.isin(self.clusters)]
+        return project_df
+
+    def _checkpoint_files(self) -> tuple[Path, Path | None]:
+        #(csv file to append to, columnar out file to convert it to at the end or None)
+        out_file = Path(self.args.outfile)
+        if table_format(out_file) != "csv":
+            return out_file.with_suffix(".checkpoint.csv"), out_file
+        return out_file, None
+
+    def _scrape_batches(self, todo_df: pd.DataFrame, out_file: Path, progress: tqdm) -> None:
+        if not out_file.exists():  #the header, also if there is nothing to scrape
+            todo_df.iloc[:0].assign(cordis_keywords=[]).to_csv(out_file, index=False)
+        batch_size = self.args.batch_size
+        for start in range(0, len(todo_df), batch_size):
+            batch_df = todo_df.iloc[start:start + batch_size].copy()
+            batch_df["cordis_keywords"] = self.get_keywords(batch_df["id"].tolist(), leave=False)
+            batch_df.to_csv(out_file, mode="a", header=False, index=False)
+            progress.update(len(batch_df))
+
+    def _finish_checkpoint(self, out_file: Path, columnar_file: Path | None) -> Path:
+        self._compact_checkpoint(out_file)
+        if columnar_file is not None:
+            print(f"Writing to {columnar_file} ...")
+            write_table(read_table(out_file), columnar_file)
+            out_file.unlink()  #done, a later run must not resume from it
+            return columnar_file
+        return out_file
+
+    def _read_done_ids(self, out_file: Path, columns: list[str]) -> set:
+        # ids of projects in a previous (partial) run, with usable keywords in their latest row
+        if not out_file.exists():
+            return set()
+        header = list(pd.read_csv(out_file, nrows=0).columns)
+        if header != columns:
+            raise ValueError(f"Can't resume from {out_file}, its columns {header} don't match {columns}.")
+
+        status = {}
+        for chunk in pd.read_csv(out_file, usecols=["id", "cordis_keywords"], chunksize=100_000):
+            status.update(zip(chunk["id"], ~chunk["cordis_keywords"].isin(["ERROR", "NOT FOUND"])))
+        return {project_id for project_id, done in status.items() if done}
+
+    def _compact_checkpoint(self, out_file: Path) -> None:
+        # retried projects were appended again, keep only their latest row
+        if not out_file.exists():
+            return
+        ids = pd.read_csv(out_file, usecols=["id"])["id"]
+        keep = (~ids.duplicated(keep="last")).to_numpy()
+        if keep.all():
+            return
+
+        tmp_file = out_file.with_suffix(out_file.suffix + ".tmp")
+        offset = 0
+        for chunk in pd.read_csv(out_file, chunksize=100_000):
+            chunk_keep = keep[offset:offset + len(chunk)]
+            chunk.loc[chunk_keep].to_csv(tmp_file, mode="w" if offset == 0 else "a", header=offset == 0, index=False)
+            offset += len(chunk)
+        os.replace(tmp_file, out_file)
+
     def _cliparse_clusters(self) -> list[str] | str:
         # parse clusters
         if self.args.clusters == "all":
@@ -182,6 +605,44 @@ class KeywordExtractorEU(KeywordExtractor):
             warnings.warn(f"Can't find topic format: {topic}. returning as is.", Warning)
             return topic
 
+    def _convert_to_float_series(self, values: pd.Series) -> pd.Series:
+        #vectorized _convert_to_float, values that can't be parsed this way go through _convert_to_float
+        converted = pd.to_numeric(values.str.strip().str.replace(",", ".", regex=False), errors="coerce").astype("float64")
+        failed = converted.isna() & values.notna()
+        if failed.any():
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                converted = converted.astype(object)
+                converted[failed] = values[failed].map(self._convert_to_float)
+            self._warn_summary(caught, "ecMaxContribution values could not be converted to float, returned as is")
+        return converted
+
+    def _get_cluster_series(self, topics: pd.Series) -> pd.Series:
+        #vectorized _get_cluster, computed once per unique topic
+        unique_topics = pd.Series(topics.cat.categories, dtype=object)
+        clusters = pd.Series(None, index=unique_topics.index, dtype=object)
+        for prefix, pattern in self.CLUSTER_PATTERNS:
+            cluster_part = unique_topics.str.extract(pattern, expand=False)
+            matched = cluster_part.notna() & clusters.isna()
+            clusters[matched] = prefix + "-" + cluster_part[matched]
+
+        #other formats go through _get_cluster, which warns and returns them as is
+        unmatched = clusters.isna()
+        if unmatched.any():
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                clusters[unmatched] = unique_topics[unmatched].map(self._get_cluster)
+            self._warn_summary(caught, "topics have an unknown format, returned as is")
+
+        return topics.map(dict(zip(unique_topics, clusters))).astype("category")
+
+    def _warn_summary(self, caught: list[warnings.WarningMessage], summary: str) -> None:
+        # one warning for a whole column instead of one per row
+        if len(caught) == 0:
+            return
+        examples = "; ".join(str(w.message) for w in caught[:3])
+        warnings.warn(f"{len(caught)} {summary}, e.g. {examples}", Warning)
+
     def _get_euroscivoc_keywords(self, 
                                 project_id: str, 
                                 euroscivoc_df: pd.DataFrame) -> list[str]:
@@ -198,18 +659,79 @@ class KeywordExtractorEU(KeywordExtractor):
         self.cli_parser.add_argument("--clusters", "-c", nargs="?", const="all", default="all", type=str, help="clusters to look at (e.g. 124 for clusters 1, 2 and 4)")
         self.cli_parser.add_argument("--projectfile", "-pf", nargs='?', const=self.default_project_file, default=self.default_project_file, type=str)
         self.cli_parser.add_argument("--euroscivocfile", "-ef", nargs="?", const=self.default_euroscivoc_file, default=self.default_euroscivoc_file, type=str)
+        self.cli_parser.add_argument("--outfile", "-of", nargs="?", const=self.default_out_file, default=self.default_out_file, type=str, help="output file, .csv, .parquet or .feather")
+        self.cli_parser.add_argument("--checkpoint", action="store_true", help="append results to the out file in batches and resume from it when restarted")
+        self.cli_parser.add_argument("--batch-size", "-bs", default=500, type=int, help="projects per checkpointed batch")
+        self.cli_parser.add_argument("--stream", action="store_true", help="like --checkpoint, reading the project file in chunks, for inputs that don't fit in memory")
+        self.cli_parser.add_argument("--chunk-size", "-cs", default=10_000, type=int, help="projects read at a time with --stream")
+        self.cli_parser.add_argument("--euroscivoc-index", default=self.default_euroscivoc_index, type=str, help="index of the euroSciVoc keywords built for --stream")
+        self.cli_parser.add_argument("--delta", action="store_true", help="only get the keywords of projects that are new or updated (contentUpdateDate) since the last --delta run, merged into the out file")
+        self.cli_parser.add_argument("--delta-state", default=self.default_delta_state, type=str, help="id and contentUpdateDate of the projects of the last --delta run")
+        self.cli_parser.add_argument("--delta-ids", default=self.default_delta_ids, type=str, help="ids of the projects changed by --delta, for categorize.py --delta")
+        self.cli_parser.add_argument("--source", default="scrape", choices=["scrape", "export"], help="get the CORDIS keywords by scraping the project pages or from a local bulk export (--export-file)")
+        self.cli_parser.add_argument("--export-file", default=self.default_export_file, type=str, help="CORDIS bulk export for --source export, .zip of the xml or json export, or an extracted .xml/.json file")
+        self.cli_parser.add_argument("--export-members", nargs="+", default=CordisExport.MEMBERS, type=str, help="file name patterns of the project files in a .zip --export-file")
+        self.cli_parser.add_argument("--workers", "-w", default=1, type=int, help="number of concurrent requests to CORDIS")
+        self.cli_parser.add_argument("--rate-limit", "-rl", default=None, type=float, help="max requests per second to a host (default: no limit)")
+        self.cli_parser.add_argument("--retries", default=3, type=int, help="retries of a request on errors and 429/5xx responses")
+        self.cli_parser.add_argument("--backoff", default=2, type=float, help="backoff factor, the n-th retry waits backoff * 2^(n-1) seconds (none before the first)")
+        self.cli_parser.add_argument("--timeout", default=10, type=float, help="request timeout in seconds")
+        self.cli_parser.add_argument("--base-url", default=None, type=str, help="project page url to scrape, the id is appended (default: CORDIS), e.g. the stand-in of benchmarks/cordis_stub_server.py")
+        self.cli_parser.add_argument("--cache-dir", "-cd", nargs="?", const=self.default_cache_dir, default=None, type=str, help="cache scraped pages and keywords in this directory (default: no cache)")
+        self.cli_parser.add_argument("--cache-ttl", default=None, type=float, help="hours before a cached page is revalidated with CORDIS (default: never)")
+        self.cli_parser.add_argument("--cache-max-size", default=None, type=float, help="max size of the cache in MB, least recently used pages are evicted (default: unbounded)")
         self.args = self.cli_parser.parse_args()
+        if self.args.delta and (self.args.checkpoint or self.args.stream):
+            self.cli_parser.error("--delta can't be combined with --checkpoint or --stream")
     
     def _setup_args(self):
         self.args = argparse.Namespace()
         self.args.clusters = "all"
         self.args.projectfile = self.default_project_file
         self.args.euroscivocfile = self.default_euroscivoc_file
+        self.args.outfile = self.default_out_file
+        self.args.checkpoint = False
+        self.args.batch_size = 500
+        self.args.stream = False
+        self.args.chunk_size = 10_000
+        self.args.euroscivoc_index = self.default_euroscivoc_index
+        self.args.delta = False
+        self.args.delta_state = self.default_delta_state
+        self.args.delta_ids = self.default_delta_ids
+        self.args.source = "scrape"
+        self.args.export_file = self.default_export_file
+        self.args.export_members = CordisExport.MEMBERS
+        self.args.workers = 1
+        self.args.rate_limit = None
+        self.args.retries = 3
+        self.args.backoff = 2
+        self.args.timeout = 10
+        self.args.base_url = None
+        self.args.cache_dir = None
+        self.args.cache_ttl = None
+        self.args.cache_max_size = None
     
     #-- main function
     def run(self):
-        project_df = self.process_csv_files()
-        project_df = self.get_cordis_keywords(project_df)
+        if not self.args.delta:  #the ids of an earlier --delta run don't describe the new out file
+            Path(self.args.delta_ids).unlink(missing_ok=True)
+        if self.args.stream:
+            with metrics.stage("stream"):
+                self.get_cordis_keywords_streamed()
+            metrics.save("extract_keywords")
+            return
+
+        with metrics.stage("read_csv"):
+            project_df = self.process_csv_files()
+        metrics.count("projects", len(project_df))
+        with metrics.stage("scrape"):
+            if self.args.delta:
+                self.get_cordis_keywords_delta(project_df)
+            elif self.args.checkpoint:
+                self.get_cordis_keywords_checkpointed(project_df)
+            else:
+                project_df = self.get_cordis_keywords(project_df)
+        metrics.save("extract_keywords")
         
 
 if __name__ == "__main__":
@@ -1,66 +1,111 @@
-import ast
+import argparse
 import json
 import numpy as np
 import pandas as pd
+from metrics import metrics
+from tables import read_table
 
 
-def has_cat(row, cat):
-    if row.categories is None:
-        return False
-    if cat in row.categories:
-        return True
-
-    if row.subcategories is None:
-        return False
-    if cat in np.array(row.subcategories)[:, 1]:
-        return True
-
-    if row.subsubcategories is None:
-        return False
-    if cat in np.array(row.subsubcategories)[:, 1]:
-        return True
-
-    return False
-
-
-categorized_df = pd.read_csv("../out/categorized.csv")
-categorized_df["categories"] = categorized_df.apply(lambda row: ast.literal_eval(row.categories) if pd.notna(row.categories) else None, axis=1)
-categorized_df["subcategories"] = categorized_df.apply(lambda row: ast.literal_eval(row.subcategories) if pd.notna(row.subcategories) else None, axis=1)
-categorized_df["subsubcategories"] = categorized_df.apply(lambda row: ast.literal_eval(row.subsubcategories) if pd.notna(row.subsubcategories) else None, axis=1)
-total_projects = categorized_df.index.nunique()
-total_ecmax = categorized_df["ecMaxContribution"].sum()
-
-table_df = pd.DataFrame(columns=["category", "subcategory", "subsubcategory", "number of projects", "% of all projects", "ecMaxContribution", "% of total ecMaxContribution"])
-
-# Add Total row
-table_df.loc[len(table_df)] = ["all", None, None, total_projects, 100, total_ecmax, 100]
-
-# Categories
-with open("../categorization/categories.json", "r") as f:
-    categories = json.load(f)
-with open("../categorization/subcategories.json", "r") as f:
-    subcategories = json.load(f)
-with open("../categorization/subsubcategories.json", "r") as f:
-    subsubcategories = json.load(f)
-
-categories_sorted = sorted(categories.keys())
-for cat in categories_sorted:
-    print(cat)
-    this_df = categorized_df[categorized_df.apply(lambda row: has_cat(row, cat), axis=1)]
-    table_df.loc[len(table_df)] = [cat.upper(), None, None, len(this_df), round(len(this_df)/total_projects*100, 2), round(this_df["ecMaxContribution"].sum(), 2), round(this_df["ecMaxContribution"].sum()/total_ecmax*100, 2)]
-
-    if cat in subcategories.keys():
-        cat_subs = sorted(subcategories[cat].keys())
-        for subcat in cat_subs:
-            print(subcat)
-            this_df = categorized_df[categorized_df.apply(lambda row: has_cat(row, subcat), axis=1)]
-            table_df.loc[len(table_df)] = [cat.upper(), subcat.upper(), None, len(this_df), round(len(this_df)/total_projects*100, 2), round(this_df["ecMaxContribution"].sum(), 2), round(this_df["ecMaxContribution"].sum()/total_ecmax*100, 2)]
-
-            if subcat in subsubcategories:
-                cat_subsubs = sorted(subsubcategories[subcat].keys())
-                for subsubcat in cat_subsubs:
-                    print(subsubcat)
-                    this_df = categorized_df[categorized_df.apply(lambda row: has_cat(row, subsubcat), axis=1)]
-                    table_df.loc[len(table_df)] = [cat.upper(), subcat.upper(), subsubcat.upper(), len(this_df), round(len(this_df)/total_projects*100, 2), round(this_df["ecMaxContribution"].sum(), 2), round(this_df["ecMaxContribution"].sum()/total_ecmax*100, 2)]
-
-table_df.to_csv("overviewCategories.csv", index=False)
+def get_row_categories(categories, subcategories, subsubcategories) -> list[str]:
+    """
+    All (sub)(sub)categories a project counts for. Subcategories only count if the project has
+    categories and subsubcategories only if it has subcategories.
+    """
+    if categories is None:
+        return []
+    row_categories = list(categories)
+
+    if subcategories is None:
+        return row_categories
+    row_categories += [subcategory for _, subcategory in subcategories]
+
+    if subsubcategories is None:
+        return row_categories
+    row_categories += [subsubcategory for _, subsubcategory in subsubcategories]
+    return row_categories
+
+
+def membership_matrix(categorized_df: pd.DataFrame, nodes: pd.Index) -> np.ndarray:
+    """
+    Boolean project x node matrix, True if the project counts for the (sub)(sub)category of the node.
+    """
+    row_categories = pd.Series([
+        get_row_categories(categories, subcategories, subsubcategories)
+        for categories, subcategories, subsubcategories in zip(
+            categorized_df.categories, categorized_df.subcategories, categorized_df.subsubcategories
+        )
+    ], dtype=object).explode().dropna()
+
+    node_pos = nodes.get_indexer(row_categories)
+    in_nodes = node_pos >= 0
+    membership = np.zeros((len(categorized_df), len(nodes)), dtype=bool)
+    membership[row_categories.index.to_numpy()[in_nodes], node_pos[in_nodes]] = True
+    return membership
+
+
+def get_table_nodes(categories: dict, subcategories: dict, subsubcategories: dict) -> list[tuple[str, str | None, str | None]]:
+    # (category, subcategory, subsubcategory) of every row in the table, in table order
+    table_nodes = []
+    for cat in sorted(categories.keys()):
+        table_nodes.append((cat, None, None))
+        if cat not in subcategories.keys():
+            continue
+
+        for subcat in sorted(subcategories[cat].keys()):
+            table_nodes.append((cat, subcat, None))
+            if subcat not in subsubcategories:
+                continue
+
+            for subsubcat in sorted(subsubcategories[subcat].keys()):
+                table_nodes.append((cat, subcat, subsubcat))
+    return table_nodes
+
+
+if __name__ == "__main__":
+    default_categorized_file = "../out/categorized.csv"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--categorizedfile", "-cf", nargs='?', const=default_categorized_file, default=default_categorized_file, type=str, help=".csv, .parquet or .feather")
+    parser.add_argument("--categoriesfile", default="../categorization/categories.json", type=str)
+    parser.add_argument("--subcategoriesfile", default="../categorization/subcategories.json", type=str)
+    parser.add_argument("--subsubcategoriesfile", default="../categorization/subsubcategories.json", type=str)
+    parser.add_argument("--outfile", "-of", default="overviewCategories.csv", type=str)
+    args = parser.parse_args()
+
+    with metrics.stage("read"):
+        categorized_df = read_table(args.categorizedfile).reset_index(drop=True)
+    metrics.count("projects", len(categorized_df))
+    total_projects = categorized_df.index.nunique()
+    total_ecmax = categorized_df["ecMaxContribution"].sum()
+
+    with open(args.categoriesfile, "r") as f:
+        categories = json.load(f)
+    with open(args.subcategoriesfile, "r") as f:
+        subcategories = json.load(f)
+    with open(args.subsubcategoriesfile, "r") as f:
+        subsubcategories = json.load(f)
+
+    # The (sub)(sub)category of a row is the last one given, the counts and sums of all of them
+    # come from one pass over the projects.
+    table_nodes = get_table_nodes(categories, subcategories, subsubcategories)
+    nodes = pd.Index(sorted({[node for node in table_node if node is not None][-1] for table_node in table_nodes}))
+    with metrics.stage("rollup"):
+        membership = membership_matrix(categorized_df, nodes)
+        node_counts = membership.sum(axis=0)
+        node_ecmax = categorized_df["ecMaxContribution"].fillna(0).to_numpy(dtype=float) @ membership
+
+    # Add Total row
+    rows = [["all", None, None, total_projects, 100, total_ecmax, 100]]
+    for cat, subcat, subsubcat in table_nodes:
+        i = nodes.get_loc([node for node in (cat, subcat, subsubcat) if node is not None][-1])
+        count, ecmax = node_counts[i], node_ecmax[i]
+        rows.append([
+            cat.upper(),
+            subcat.upper() if subcat is not None else None,
+            subsubcat.upper() if subsubcat is not None else None,
+            count, round(count/total_projects*100, 2), round(ecmax, 2), round(ecmax/total_ecmax*100, 2)
+        ])
+
+    table_df = pd.DataFrame(rows, columns=["category", "subcategory", "subsubcategory", "number of projects", "% of all projects", "ecMaxContribution", "% of total ecMaxContribution"])
+    print(f"Writing to {args.outfile} ...")
+    table_df.to_csv(args.outfile, index=False)
+    metrics.save("gen_table")
@@ -1,113 +1,101 @@
 import argparse
-import ast
 import csv
+import numpy as np
 import pandas as pd
 
-from tqdm import tqdm
-
-
-def count_keywords(
-                    ecmax: float, 
-                    cluster: str, 
-                    vals: list[str], 
-                    freqs: dict, 
-                    financial: dict
+from metrics import metrics
+from normalize import lowercase_keyword
+from tables import read_table
+from vocabulary import Vocabulary, get_vocabulary
+
+
+def aggregate_keywords(extracted_df: pd.DataFrame, vocabulary: Vocabulary) -> tuple[pd.Index, pd.Index, np.ndarray, np.ndarray]:
+    """
+    Count the projects and sum the ecMaxContribution per keyword of the vocabulary for all clusters in one pass.
+    Keywords are counted lowercased only (not stripped, quotes kept).
+    Returns (keywords, clusters, counts, financial), where counts and financial are
+    keyword x cluster matrices with the totals over all clusters in column 0.
+    Keywords are in order of first occurrence (cordis keywords first), sums are accumulated in project order.
+    """
+    keywords, row_pos, kw_codes = vocabulary.key_pairs(lowercase_keyword)
+    keywords = pd.Index(keywords, dtype=object)
+    cluster_codes, clusters = pd.factorize(extracted_df.cluster.astype(object), sort=False)
+    kw_cluster_codes = cluster_codes[row_pos] + 1  # 0 is "all"
+    kw_ecmax = extracted_df.ecMaxContribution.to_numpy(dtype=float)[row_pos]
+
+    # np.add.at adds unbuffered, in order, so sums match adding up project by project
+    counts = np.zeros((len(keywords), len(clusters) + 1), dtype=np.int64)
+    financial = np.zeros((len(keywords), len(clusters) + 1), dtype=np.float64)
+    in_cluster = kw_cluster_codes > 0  # rows without a cluster only count for "all"
+    np.add.at(counts[:, 0], kw_codes, 1)
+    np.add.at(financial[:, 0], kw_codes, kw_ecmax)
+    np.add.at(counts, (kw_codes[in_cluster], kw_cluster_codes[in_cluster]), 1)
+    np.add.at(financial, (kw_codes[in_cluster], kw_cluster_codes[in_cluster]), kw_ecmax[in_cluster])
+    return keywords, pd.Index(["all"]).append(clusters), counts, financial
+
+
+def get_cluster_headers(clusters: pd.Index) -> list[str]:
+    # HORIZON-CL clusters first in ascending order, then the others in descending order
+    clusters = sorted([cluster for cluster in clusters if cluster != "all"], reverse=True)
+    horizon_cl_clusters = sorted([cluster for cluster in clusters if cluster.startswith("HORIZON-CL")])
+    return horizon_cl_clusters + [cluster for cluster in clusters if cluster not in horizon_cl_clusters]
+
+
+def write_keyword_table(
+                    out_file: str,
+                    total_label: str,
+                    totals: list,
+                    keywords: pd.Index,
+                    values: np.ndarray,
+                    present: np.ndarray,
+                    columns: list[int],
+                    cluster_headers: list[str]
                 ) -> None:
+    """
+    Write one row per keyword, sorted on the "all" column (descending, ties in order of first occurrence).
+    Clusters without the keyword get 0.
+    """
+    print(f"Writing to {out_file} ...")
+    values = values[:, columns].tolist()
+    present = present[:, columns]
+    order = sorted(range(len(keywords)), key=lambda i: values[i][0], reverse=True)
+    with open(out_file, "w+") as f:
+        writer = csv.writer(f)
+        writer.writerow(["keyword"] + cluster_headers)
+        writer.writerow([total_label] + totals)
+        for i in order:
+            writer.writerow([keywords[i]] + [val if has_kw else 0 for val, has_kw in zip(values[i], present[i])])
 
-    kw_set = set()
-    for val in vals:
-        if pd.isna(val) or not val[0] == "[":
-            continue
-
-        val = val.lower()
-        kws = ast.literal_eval(val) #could also use explode
-
-        for kw in kws:
-            kw = kw.lower()
-            kw_set.add(kw)
-
-    # Count keywords
-    if cluster not in freqs.keys():
-        freqs[cluster] = {}
-        financial[cluster] = {}
-
-    for kw in kw_set:
-        if kw in freqs["all"].keys():
-            freqs["all"][kw] += 1
-            financial["all"][kw] += ecmax
-        else:
-            freqs["all"][kw] = 1
-            financial["all"][kw] = ecmax
-        if kw in freqs[cluster].keys():
-            freqs[cluster][kw] += 1
-            financial[cluster][kw] += ecmax
-        else:
-            freqs[cluster][kw] = 1
-            financial[cluster][kw] = ecmax
-
-
-def sort_dict(d: dict) -> dict:
-    for key in d.keys():
-        d[key] = dict(sorted(d[key].items(), key=lambda x: x[1], reverse=True))
-    return dict(sorted(d.items(), key=lambda x: x[0], reverse=True))
-
-def get_row_for_file(kw: str, cluster_row: list[str], d: dict) -> list[str | int]:
-    row = [kw]
-    for cluster in cluster_row:
-        if kw in d[cluster]:
-            row.append(d[cluster][kw])
-        else:
-            row.append(0)
-    return row
 
 if __name__ == "__main__":
     # Set up argument parser
     default_extracted_file = "./out/extracted.csv"
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("--extractedfile", "-ef", nargs='?', const=default_extracted_file, default=default_extracted_file, type=str)
+    parser.add_argument("--extractedfile", "-ef", nargs='?', const=default_extracted_file, default=default_extracted_file, type=str, help=".csv, .parquet or .feather")
     args = parser.parse_args()
-    extracted_df = pd.read_csv(args.extractedfile)
-
-    freqs = {"all": {}}
-    financial = {"all": {}}
-
-    tqdm.pandas(desc="Analyzing projects", leave=False, miniters=1)
-
-    extracted_df.progress_apply(
-        lambda row: count_keywords(row.ecMaxContribution, row.cluster,
-                                   [row.cordis_keywords, row.euroscivoc_keywords],
-                                    freqs, financial), axis=1
-    )
-
-    freqs = sort_dict(freqs)
-    financial = sort_dict(financial)
-
-    horizon_cl_clusters = sorted([key for key in freqs.keys() if key.startswith("HORIZON-CL")])
-    cluster_headers = horizon_cl_clusters + \
-        [key for key in freqs.keys() if key != "all" and key not in horizon_cl_clusters ]
-    totalcount = extracted_df.id.count()
-    total_counts = [totalcount] + [extracted_df[extracted_df.cluster == cluster].id.count()
-                                   for cluster in cluster_headers]
-    totalecmax = extracted_df.ecMaxContribution.sum()
-    total_financial = [totalecmax] + [extracted_df[extracted_df.cluster == cluster].ecMaxContribution.sum()
-                                      for cluster in cluster_headers]
-    cluster_headers = ["all"] + cluster_headers
-
-    counts_file = "./out/kw_counts.csv"
-    print(f"Writing to {counts_file} ...")
-    with open(counts_file, "w+") as f:
-        writer = csv.writer(f)
-        writer.writerow(["keyword"] + cluster_headers)
-        writer.writerow(["Total count"] + total_counts)
-        for kw in freqs["all"].keys():
-            writer.writerow(get_row_for_file(kw, cluster_headers, freqs))
-
-    financial_file = "./out/kw_ecmax.csv"
-    print(f"Writing to {financial_file} ...")
-    with open(financial_file, "w+") as f:
-        writer = csv.writer(f)
-        writer.writerow(["keyword"] + cluster_headers)
-        writer.writerow(["Total EC max"] + total_financial)
-        for kw in financial["all"].keys():
-            writer.writerow(get_row_for_file(kw, cluster_headers, financial))
+    with metrics.stage("read"):
+        extracted_df = read_table(args.extractedfile).reset_index(drop=True)
+    with metrics.stage("vocabulary"):
+        vocabulary = get_vocabulary(args.extractedfile)
+    metrics.count("projects", len(extracted_df))
+    metrics.count("keywords", len(vocabulary))
+
+    print("Analyzing projects...")
+    with metrics.stage("aggregate"):
+        keywords, clusters, counts, financial = aggregate_keywords(extracted_df, vocabulary)
+
+    cluster_headers = ["all"] + get_cluster_headers(clusters)
+    columns = [clusters.get_loc(cluster) for cluster in cluster_headers]
+
+    by_cluster = extracted_df.groupby(extracted_df.cluster.astype(object), sort=False)
+    cluster_counts = by_cluster.id.count()
+    cluster_ecmax = by_cluster.ecMaxContribution.agg(lambda ecmax: ecmax.sum())
+    total_counts = [extracted_df.id.count()] + [cluster_counts[cluster] for cluster in cluster_headers[1:]]
+    total_financial = [extracted_df.ecMaxContribution.sum()] + [cluster_ecmax[cluster] for cluster in cluster_headers[1:]]
+
+    present = counts > 0
+    with metrics.stage("write"):
+        write_keyword_table("./out/kw_counts.csv", "Total count", total_counts, keywords, counts, present, columns, cluster_headers)
+        write_keyword_table("./out/kw_ecmax.csv", "Total EC max", total_financial, keywords, financial, present, columns, cluster_headers)
+    metrics.save("get_most_occurring_keywords")
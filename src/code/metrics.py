@@ -0,0 +1,179 @@
+"""
+Instrumentation shared by the pipeline scripts: wall and CPU time and peak memory per stage of a script,
+counters (requests, retries, cache hits, ...) and histograms (request latencies, comparisons per keyword, ...).
+Every script writes one JSON report when it is done, to out/metrics/<run>-<script>.json, so a long run
+can be broken down afterwards. main.py sets the run id, so the reports of one pipeline run share it.
+
+usage:
+    from metrics import metrics
+    with metrics.stage("scrape"):
+        ...
+        metrics.count("http.requests")
+        metrics.observe("http.latency_seconds", seconds)
+    metrics.save("extract_keywords")
+
+Peak memory is the peak RSS of the process, which only goes up, so per stage it is reported together with
+how much the stage raised it. Set METRICS_TRACEMALLOC=1 (or call trace_memory) for the peak of the Python
+allocations within each stage, at the cost of slower allocations.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+METRICS_DIR = Path(__file__).resolve().parent.parent / "out" / "metrics"
+RUN_ID_ENV = "METRICS_RUN_ID"
+TRACEMALLOC_ENV = "METRICS_TRACEMALLOC"
+PERCENTILES = [50, 95, 99]
+
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # not on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(values: list[float]) -> dict:
+    if len(values) == 0:
+        return {"count": 0}
+    values = np.asarray(values, dtype=float)
+    summary = {"count": len(values), "sum": float(values.sum()), "mean": float(values.mean()), "min": float(values.min())}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{percentile}"] = float(value)
+    summary["max"] = float(values.max())
+    return summary
+
+
+class Metrics:
+    """
+    Counters and histograms can be updated from any thread, stages are meant for the main thread.
+    Nested stages are reported as "outer/inner", a stage that runs more than once is added up.
+    """
+    def __init__(self) -> None:
+        self.stages = {}  # {name: {"calls", "wall_seconds", "cpu_seconds", ...}}
+        self.counters = Counter()
+        self.histograms = {}  # {name: [values]}
+        self.started = datetime.now()
+        self._start = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._lock = threading.Lock()
+        self._stack = []  # stages that are running, with the peak traced memory of their finished inner stages
+        if os.environ.get(TRACEMALLOC_ENV, "") not in ["", "0"]:
+            self.trace_memory()
+
+    def trace_memory(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str):
+        name = "/".join([entry["name"] for entry in self._stack] + [name])
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # the peak so far belongs to the outer stage, the peak of this one starts here
+            if len(self._stack) > 0:
+                self._stack[-1]["traced_peak"] = max(self._stack[-1]["traced_peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        entry = {"name": name.rsplit("/", 1)[-1], "traced_peak": 0}
+        self._stack.append(entry)
+        rss_before = peak_rss_mb()
+        start, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start, time.process_time() - start_cpu
+            self._stack.pop()
+            stage = self.stages.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            stage["calls"] += 1
+            stage["wall_seconds"] += wall
+            stage["cpu_seconds"] += cpu
+            rss = peak_rss_mb()
+            if rss is not None:
+                stage["peak_rss_mb"] = rss
+                stage["peak_rss_increase_mb"] = stage.get("peak_rss_increase_mb", 0.0) + rss - rss_before
+            if tracing and tracemalloc.is_tracing():
+                traced_peak = max(entry["traced_peak"], tracemalloc.get_traced_memory()[1])
+                stage["traced_peak_mb"] = max(stage.get("traced_peak_mb", 0.0), traced_peak / 1024**2)
+                if len(self._stack) > 0:
+                    self._stack[-1]["traced_peak"] = max(self._stack[-1]["traced_peak"], traced_peak)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            self.histograms.setdefault(name, []).append(value)
+
+    def pop(self) -> dict:
+        """
+        Counters and histogram values since the last pop, e.g. to merge the metrics of worker processes with merge.
+        """
+        with self._lock:
+            collected = {"counters": dict(self.counters), "histograms": self.histograms}
+            self.counters = Counter()
+            self.histograms = {}
+        return collected
+
+    def merge(self, collected: dict) -> None:
+        with self._lock:
+            self.counters.update(collected["counters"])
+            for name, values in collected["histograms"].items():
+                self.histograms.setdefault(name, []).extend(values)
+
+    def report(self, script: str) -> dict:
+        with self._lock:
+            counters = dict(sorted(self.counters.items()))
+            histograms = {name: summarize(values) for name, values in sorted(self.histograms.items())}
+        # hit rate of every cache with <name>.hits and <name>.misses counters
+        hit_rates = {}
+        for name in counters:
+            prefix = name[:-len(".hits")]
+            if name.endswith(".hits") and f"{prefix}.misses" in counters:
+                lookups = counters[name] + counters[f"{prefix}.misses"]
+                hit_rates[prefix] = counters[name] / lookups if lookups > 0 else None
+        return {
+            "script": script,
+            "run": run_id(),
+            "argv": sys.argv,
+            "started": self.started.isoformat(timespec="seconds"),
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "wall_seconds": time.perf_counter() - self._start,
+            "cpu_seconds": time.process_time() - self._start_cpu,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.stages,
+            "counters": counters,
+            "hit_rates": hit_rates,
+            "histograms": histograms,
+        }
+
+    def save(self, script: str, out_dir: str | Path = METRICS_DIR) -> Path:
+        out_file = Path(out_dir) / f"{run_id()}-{script}.json"
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(out_file, "w") as f:
+            json.dump(self.report(script), f, indent=2)
+        print(f"Metrics written to {out_file}")
+        return out_file
+
+
+def run_id() -> str:
+    run = os.environ.get(RUN_ID_ENV)
+    if run is None:
+        # scripts that run on their own get their own id
+        run = metrics.started.strftime("%Y%m%d-%H%M%S")
+    return run
+
+
+metrics = Metrics()
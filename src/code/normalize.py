@@ -0,0 +1,59 @@
+"""
+Keyword normalization shared by the categorization and the counting scripts. The patterns are compiled
+once and the results of the single keyword functions are memoized (bounded), as the same keywords and
+category keywords come by again and again; the *_keywords variants do a whole pandas Series at once,
+computing every distinct keyword once.
+    normalize_keyword   lowercase, stripped, without quotes: the keywords of kw_categorizations.csv (get_keyword_mappings.py)
+    strip_keyword       lowercase ascii letters and digits only: the key keywords are matched on (categorizer.py)
+    keyword_tokens      strip_keyword of every token of a keyword, split on whitespace and punctuation
+    lowercase_keyword   lowercase only: the keywords of kw_counts.csv/kw_ecmax.csv (get_most_occurring_keywords.py)
+    match_keyword       lowercase and stripped: the key projects are matched to kw_categorizations.csv on (categorize.py)
+"""
+import re
+from functools import lru_cache
+import pandas as pd
+from unidecode import unidecode
+
+NON_ALPHANUMERIC = re.compile(r"[^a-zA-Z0-9]")
+TOKEN_SEPARATORS = re.compile(r"[\s\-_/#@\.,\(\)\[\]\|\&]")
+CACHE_SIZE = 1 << 18  # keywords per memo cache
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_keyword(kw: str) -> str:
+    return kw.lower().strip().replace("\"", "")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def strip_keyword(kw: str) -> str:
+    # "Machine-Learning" -> "machinelearning", "Café" -> "cafe"
+    return NON_ALPHANUMERIC.sub("", unidecode(kw.lower()))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def keyword_tokens(kw: str) -> tuple[str, ...]:
+    return tuple(strip_keyword(token) for token in TOKEN_SEPARATORS.split(kw))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def lowercase_keyword(kw: str) -> str:
+    return kw.lower()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def match_keyword(kw: str) -> str:
+    return kw.lower().strip()
+
+
+def _map_unique(kws: pd.Series, func) -> pd.Series:
+    # func once per distinct keyword, missing values stay missing
+    unique_kws = kws.dropna().unique()
+    return kws.map(dict(zip(unique_kws, map(func, unique_kws))))
+
+
+def normalize_keywords(kws: pd.Series) -> pd.Series:
+    return _map_unique(kws, normalize_keyword)
+
+
+def strip_keywords(kws: pd.Series) -> pd.Series:
+    return _map_unique(kws, strip_keyword)
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+class PageCache():
+    """
+    On-disk cache of CORDIS project pages and the keywords parsed from them.
+
+    Entries are addressed by a hash of the project ID and stored as two files:
+    <key>.html with the raw page and <key>.json with the metadata
+    (url, etag, last_modified, fetched_at and, once parsed, the keywords).
+    Entries older than ttl seconds are stale: they are revalidated with the stored
+    ETag/Last-Modified or fetched again. If max_size (bytes) is set, the least recently
+    used entries are evicted once the cache grows beyond it.
+    """
+    def __init__(self, cache_dir: str | Path, ttl: float | None = None, max_size: int | None = None):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl              #seconds, None: entries never go stale
+        self.max_size = max_size    #bytes, None: unbounded
+        self._size = None           #total size of the cache, computed on first write
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get(self, project_id: str) -> dict | None:
+        """
+        Returns the metadata of the cached entry, or None on a cache miss.
+        """
+        html_path, meta_path = self._paths(project_id)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if not html_path.exists():
+            return None
+        os.utime(meta_path)  #mark as recently used
+        return meta
+
+    def get_html(self, project_id: str) -> str | None:
+        html_path, _ = self._paths(project_id)
+        try:
+            return html_path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def is_fresh(self, meta: dict) -> bool:
+        if meta.get("stale", False):
+            return False
+        return self.ttl is None or time.time() - meta["fetched_at"] < self.ttl
+
+    def put(self,
+            project_id: str,
+            html_txt: str,
+            url: str = None,
+            etag: str = None,
+            last_modified: str = None) -> None:
+        """
+        Store a freshly downloaded page, this drops previously parsed keywords.
+        """
+        html_path, meta_path = self._paths(project_id)
+        html_path.parent.mkdir(exist_ok=True)
+        old_size = self._entry_size(html_path, meta_path)
+        meta = {
+            "project_id": str(project_id),
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+        }
+        self._write(html_path, html_txt)
+        self._write(meta_path, json.dumps(meta))
+        self._grow(self._entry_size(html_path, meta_path) - old_size)
+
+    def put_keywords(self, project_id: str, keywords: list[str] | str, parser: str) -> None:
+        """
+        Store the keywords parsed from the cached page. parser identifies the parse setup
+        (tag and attribute), keywords parsed with another setup are not reused.
+        """
+        meta = self.get(project_id)
+        if meta is None:
+            return
+        meta["keywords"] = keywords
+        meta["parser"] = parser
+        self._write(self._paths(project_id)[1], json.dumps(meta))
+
+    def touch(self, project_id: str) -> None:
+        """
+        Mark a stale entry as fresh again, e.g. after the server answered 304 Not Modified.
+        """
+        meta = self.get(project_id)
+        if meta is None:
+            return
+        meta["fetched_at"] = time.time()
+        meta.pop("stale", None)
+        self._write(self._paths(project_id)[1], json.dumps(meta))
+
+    def expire(self, project_id: str) -> None:
+        """
+        Mark an entry as stale whatever the ttl, so it is revalidated on its next use,
+        e.g. a page without keywords, which a later run retries.
+        """
+        meta = self.get(project_id)
+        if meta is None:
+            return
+        meta["stale"] = True
+        meta.pop("keywords", None)
+        self._write(self._paths(project_id)[1], json.dumps(meta))
+
+    #-- helper functions
+    def _paths(self, project_id: str) -> tuple[Path, Path]:
+        key = hashlib.sha1(str(project_id).encode("utf-8")).hexdigest()
+        entry_dir = self.cache_dir / key[:2]
+        return entry_dir / f"{key}.html", entry_dir / f"{key}.json"
+
+    def _write(self, path: Path, txt: str) -> None:
+        # write to a temp file first, so readers never see half written entries
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(txt)
+        os.replace(tmp_path, path)
+
+    def _entry_size(self, *paths: Path) -> int:
+        return sum(p.stat().st_size for p in paths if p.exists())
+
+    def _grow(self, n_bytes: int) -> None:
+        if self.max_size is None:
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = sum(p.stat().st_size for p in self.cache_dir.glob("*/*") if p.suffix in (".html", ".json"))
+            else:
+                self._size += n_bytes
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self) -> None:
+        # drop least recently used entries until the cache is back under 90% of max_size,
+        # so not every write past the limit triggers a new scan
+        entries = sorted(self.cache_dir.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        for meta_path in entries:
+            if self._size <= self.max_size * 0.9:
+                break
+            html_path = meta_path.with_suffix(".html")
+            self._size -= self._entry_size(html_path, meta_path)
+            for p in (html_path, meta_path):
+                try:
+                    p.unlink()
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,118 @@
+"""
+Reading and writing of the intermediate tables of the pipeline (extracted, categorized).
+
+The format follows the file suffix: .csv stores list columns as Python list reprs (as before),
+.parquet and .feather store them as native list columns, so loading them needs no ast.literal_eval.
+Columnar formats can't mix lists and strings in one column, so the "ERROR"/"NOT FOUND" markers
+of cordis_keywords are stored in a separate <column>_status column and restored on read.
+
+usage (export/convert): python code/tables.py out/extracted.parquet out/extracted.csv
+"""
+import argparse
+import ast
+import pandas as pd
+from pathlib import Path
+from typing import Iterator
+
+KEYWORD_COLUMNS = ["cordis_keywords", "euroscivoc_keywords"]
+CATEGORY_COLUMNS = ["categories", "subcategories", "subsubcategories"]
+LIST_COLUMNS = KEYWORD_COLUMNS + CATEGORY_COLUMNS
+COLUMNAR_FORMATS = ["parquet", "feather"]
+
+
+def table_format(path: str | Path) -> str:
+    fmt = Path(path).suffix.lstrip(".").lower()
+    if fmt not in ["csv"] + COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown table format of {path}, use .csv, .parquet or .feather.")
+    return fmt
+
+
+def parse_list(val) -> list | str | None:
+    """
+    Parse a list column value read from csv: list reprs become lists, other strings
+    (e.g. "ERROR", "NOT FOUND") are returned as is, empty values become None.
+    """
+    if isinstance(val, (list, tuple)):
+        return list(val)
+    if val is None or (isinstance(val, float) and pd.isna(val)) or val == "":
+        return None
+    if isinstance(val, str) and val.startswith("["):
+        return ast.literal_eval(val)
+    return val
+
+
+def read_table(path: str | Path, list_columns: list[str] = LIST_COLUMNS) -> pd.DataFrame:
+    """
+    Read a table, values of the list_columns in it are returned as lists
+    (pairs like (category, subcategory) as tuples), markers as strings and missing values as None.
+    """
+    fmt = table_format(path)
+    if fmt == "csv":
+        header = pd.read_csv(path, nrows=0).columns
+        return pd.read_csv(path, converters={col: parse_list for col in list_columns if col in header})
+
+    df = pd.read_parquet(path) if fmt == "parquet" else pd.read_feather(path)
+    for col in list_columns:
+        if col not in df.columns:
+            continue
+        df[col] = df[col].map(_from_arrow, na_action="ignore").astype(object)
+        df[col] = df[col].where(df[col].notna(), None)
+        status_col = f"{col}_status"
+        if status_col in df.columns:
+            has_status = df[status_col].notna()
+            df.loc[has_status, col] = df.loc[has_status, status_col]
+            df = df.drop(columns=[status_col])
+    return df
+
+
+def read_table_chunks(path: str | Path, chunksize: int = 10_000, columns: list[str] | None = None, list_columns: list[str] = LIST_COLUMNS) -> Iterator[pd.DataFrame]:
+    """
+    read_table in chunks of chunksize rows, optionally only the given columns (if in the table).
+    Columnar formats are read at once.
+    """
+    fmt = table_format(path)
+    if fmt != "csv":
+        df = read_table(path, list_columns)
+        yield df if columns is None else df[[col for col in df.columns if col in columns]]
+        return
+
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [col for col in header if columns is None or col in columns]
+    converters = {col: parse_list for col in list_columns if col in usecols}
+    yield from pd.read_csv(path, usecols=usecols, converters=converters, chunksize=chunksize)
+
+
+def write_table(df: pd.DataFrame, path: str | Path, list_columns: list[str] = LIST_COLUMNS) -> None:
+    fmt = table_format(path)
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+        return
+
+    df = df.reset_index(drop=True)
+    for col in list_columns:
+        if col not in df.columns:
+            continue
+        values = df[col].map(parse_list)
+        is_status = values.map(lambda val: isinstance(val, str))
+        df[col] = values.where(~is_status, None)
+        if is_status.any():
+            df[f"{col}_status"] = values.where(is_status, None)
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_feather(path)
+
+
+def _from_arrow(val) -> list:
+    # arrow list values come back as numpy arrays, nested ones are the (category, subcategory) pairs
+    return [tuple(v) if not isinstance(v, str) else v for v in val]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a table between csv, parquet and feather.")
+    parser.add_argument("infile", type=str)
+    parser.add_argument("outfile", type=str)
+    args = parser.parse_args()
+
+    print(f"Writing to {args.outfile} ...")
+    write_table(read_table(args.infile), args.outfile)
@@ -0,0 +1,157 @@
+"""
+The keyword vocabulary of the extracted projects: every distinct raw cordis and euroSciVoc keyword with a stable id
+(order of first occurrence) and the (project row, keyword id, keyword column) pairs, built in one streaming pass over the table.
+
+get_vocabulary saves the vocabulary next to the table (<table>.vocabulary.csv/.npz), so the scripts that
+read the same table share it instead of each going over all keywords again. The keywords are kept as they are in
+the table; every script keys them its own way with keys(normalize), computing the key once per distinct keyword.
+"""
+import os
+import numpy as np
+import pandas as pd
+from array import array
+from pathlib import Path
+from typing import Callable
+
+from normalize import normalize_keyword
+from tables import KEYWORD_COLUMNS, read_table_chunks
+
+
+class Vocabulary:
+    def __init__(self, columns: list[str] = KEYWORD_COLUMNS) -> None:
+        self.columns = columns  # keyword columns, in the order their keywords are added
+        self.kw_ids = {}  # {kw: id}
+        self.kws = []  # [kw], by id
+        self.n_projects = 0
+        self._rows = array("q")  # project row of every (row, id, column) pair
+        self._ids = array("q")
+        self._cols = array("b")  # position of the column in self.columns
+        self._keys = {}  # {normalize: (keys, key id of every kw)}
+
+    def __len__(self) -> int:
+        return len(self.kws)
+
+    def add_projects(self, df: pd.DataFrame) -> None:
+        """
+        Add the keywords of the projects in df, rows are numbered on from the projects already added.
+        """
+        columns = [df[col] if col in df.columns else [None] * len(df) for col in self.columns]
+        for row, kw_lists in enumerate(zip(*columns), start=self.n_projects):
+            for col, kw_list in enumerate(kw_lists):
+                if not isinstance(kw_list, list):  # missing, "ERROR" or "NOT FOUND"
+                    continue
+
+                column_ids = {}  # dict to keep the order of the keywords of the column
+                for kw in kw_list:
+                    if kw == "":
+                        continue
+                    kw_id = self.kw_ids.get(kw)
+                    if kw_id is None:
+                        kw_id = len(self.kws)
+                        self.kw_ids[kw] = kw_id
+                        self.kws.append(kw)
+                    column_ids[kw_id] = None
+
+                self._rows.extend([row] * len(column_ids))
+                self._ids.extend(column_ids.keys())
+                self._cols.extend([col] * len(column_ids))
+        self.n_projects += len(df)
+        self._keys = {}
+
+    def pairs(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (rows, ids, columns) of every keyword of every project, each keyword once per project and column, in project order.
+        """
+        return (np.frombuffer(self._rows, dtype=np.int64), np.frombuffer(self._ids, dtype=np.int64),
+                np.frombuffer(self._cols, dtype=np.int8))
+
+    def keys(self, normalize: Callable[[str], str]) -> tuple[list[str], np.ndarray]:
+        """
+        (keys, key id of every keyword id): the distinct normalize(kw) of the keywords, in order of first occurrence.
+        Keywords with an empty key get -1.
+        """
+        if normalize not in self._keys:
+            key_ids = {}
+            kw_keys = np.empty(len(self.kws), dtype=np.int64)
+            for kw_id, kw in enumerate(self.kws):
+                key = normalize(kw)
+                kw_keys[kw_id] = -1 if key == "" else key_ids.setdefault(key, len(key_ids))
+            self._keys[normalize] = (list(key_ids), kw_keys)
+        return self._keys[normalize]
+
+    def key_pairs(self, normalize: Callable[[str], str], columns: list[str] | None = None) -> tuple[list[str], np.ndarray, np.ndarray]:
+        """
+        (keys, rows, key ids) of every project, each key once per project, in project order. Within a project
+        the keys are in the order of columns (default: self.columns), other columns are left out.
+        """
+        keys, kw_keys = self.keys(normalize)
+        rows, ids, cols = self.pairs()
+        if columns is not None:
+            rank = np.array([columns.index(col) if col in columns else len(columns) for col in self.columns], dtype=np.int64)[cols]
+            order = np.lexsort((rank, rows))  # stable, the keywords of a column keep their order
+            order = order[rank[order] < len(columns)]
+            rows, ids = rows[order], ids[order]
+        key_ids = kw_keys[ids]
+        rows, key_ids = rows[key_ids >= 0], key_ids[key_ids >= 0]
+        first = np.sort(np.unique(rows * max(1, len(keys)) + key_ids, return_index=True)[1])
+        return keys, rows[first], key_ids[first]
+
+    def to_frame(self, normalize: Callable[[str], str] = normalize_keyword) -> pd.DataFrame:
+        """
+        The number of projects of every key (normalize_keyword: the keywords of kw_categorizations.csv).
+        """
+        keys, _, key_ids = self.key_pairs(normalize)
+        return pd.DataFrame({"count": np.bincount(key_ids, minlength=len(keys)), "kw": keys})
+
+    def save(self, path: str | Path, source_stamp: str = "") -> None:
+        # keywords in <path>.csv, pairs in <path>.npz. Written to temp files first, as scripts reading
+        # the same table can save it at the same time; the .npz last, its stamp marks the pair as complete.
+        rows, ids, cols = self.pairs()
+        for suffix in [".csv", ".npz"]:
+            tmp_file = f"{path}{suffix}.{os.getpid()}.tmp"
+            with open(tmp_file, "wb") as f:
+                if suffix == ".csv":
+                    pd.DataFrame({"kw": self.kws}).to_csv(f, index=False)
+                else:
+                    np.savez(f, rows=rows, ids=ids, cols=cols, columns=self.columns, n_projects=self.n_projects, source_stamp=source_stamp)
+            os.replace(tmp_file, f"{path}{suffix}")
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Vocabulary":
+        with np.load(f"{path}.npz") as pairs:
+            vocabulary = cls(pairs["columns"].tolist())
+            vocabulary._rows = array("q", pairs["rows"].tobytes())
+            vocabulary._ids = array("q", pairs["ids"].tobytes())
+            vocabulary._cols = array("b", pairs["cols"].tobytes())
+            vocabulary.n_projects = int(pairs["n_projects"])
+        vocabulary.kws = pd.read_csv(f"{path}.csv", dtype={"kw": str}, keep_default_na=False)["kw"].tolist()
+        vocabulary.kw_ids = {kw: kw_id for kw_id, kw in enumerate(vocabulary.kws)}
+        return vocabulary
+
+    @classmethod
+    def from_table(cls, path: str | Path, chunksize: int = 10_000, columns: list[str] = KEYWORD_COLUMNS) -> "Vocabulary":
+        vocabulary = cls(columns)
+        for chunk in read_table_chunks(path, chunksize, columns=columns):
+            vocabulary.add_projects(chunk)
+        return vocabulary
+
+
+def get_vocabulary(table_file: str | Path, chunksize: int = 10_000, save: bool = True) -> Vocabulary:
+    """
+    The vocabulary of table_file, the saved one (<table>.vocabulary.csv/.npz) if it was made from the current version of the table.
+    """
+    table_file = Path(table_file)
+    vocabulary_path = f"{table_file}.vocabulary"
+    stat = table_file.stat()
+    source_stamp = f"{table_file.name} {stat.st_size} {stat.st_mtime_ns}"
+    if Path(f"{vocabulary_path}.npz").exists() and Path(f"{vocabulary_path}.csv").exists():
+        with np.load(f"{vocabulary_path}.npz") as pairs:
+            saved_stamp = str(pairs["source_stamp"]) if "cols" in pairs.files else None  # older vocabularies have normalized keywords
+        if saved_stamp == source_stamp:
+            return Vocabulary.load(vocabulary_path)
+
+    print(f"Building keyword vocabulary of {table_file} ...")
+    vocabulary = Vocabulary.from_table(table_file, chunksize)
+    if save:
+        vocabulary.save(vocabulary_path, source_stamp)
+    return vocabulary
@@ -0,0 +1,355 @@
+"""
+Runs the pipeline: extract -> count, map -> categorize -> table.
+
+Every stage runs its script from the directory it expects and declares the files it reads
+(including its code) and writes, files given by options of the script are taken from the arguments
+it runs with (--args, --delta). A stage is skipped if the content hashes of its inputs, its
+arguments and its outputs are the same as when it last ran (out/.pipeline_state.json).
+Stages that don't depend on each other (count and map) run concurrently.
+Every run writes out/metrics/<run>-pipeline.json with the time of each stage, next to the
+metrics reports of the scripts of that run (see code/metrics.py).
+
+usage: python main.py [stages ...] [--force] [--jobs N] [--dry-run] [--args STAGE="ARGS"]
+    e.g. python main.py categorize --args extract="--workers 8 --checkpoint"
+         python main.py --delta   # monthly refresh of a new project.csv
+"""
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+STATE_FILE = ROOT / "out" / ".pipeline_state.json"
+sys.path.insert(0, str(ROOT / "code"))
+from metrics import METRICS_DIR, RUN_ID_ENV
+
+
+class File:
+    """
+    A file a stage reads or writes: path (relative to ROOT), or the value of one of the options of the script
+    (relative to the folder the stage runs in) with path as its default. With when, only if one of those
+    options is given (a flag, or flag=value). Optional inputs may be missing.
+    """
+    def __init__(self, path: str, options: list[str] = [], when: list[str] = [], optional: bool = False) -> None:
+        self.path = path
+        self.options = options
+        self.when = when
+        self.optional = optional
+
+    def resolve(self, args: list[str], cwd: str) -> str | None:
+        # the path relative to ROOT (absolute if outside of it) for the arguments the script runs with, None if not used
+        if len(self.when) > 0 and not any(has_option(args, option) for option in self.when):
+            return None
+        value = option_value(args, self.options)
+        if not isinstance(value, str):  # not given or without a value: the default
+            return self.path
+        path = Path(os.path.normpath(ROOT / cwd / value))
+        return str(path.relative_to(ROOT)) if path.is_relative_to(ROOT) else str(path)
+
+
+def option_value(args: list[str], options: list[str]) -> str | bool | None:
+    # value of the last of the options in args, True if it is given without a value, None if it isn't given
+    value = None
+    for i, arg in enumerate(args):
+        name, equals, inline_value = arg.partition("=")
+        if name not in options:
+            continue
+        if equals:
+            value = inline_value
+        elif i + 1 < len(args) and not args[i + 1].startswith("-"):
+            value = args[i + 1]
+        else:
+            value = True
+    return value
+
+
+def has_option(args: list[str], option: str) -> bool:
+    # option is a flag (--delta) or a flag with a value (--source=export)
+    name, equals, expected = option.partition("=")
+    value = option_value(args, [name])
+    return value is not None and (not equals or value == expected)
+
+
+class Stage:
+    def __init__(self, name: str, script: str, cwd: str, inputs: list[str | File], outputs: list[str | File], args: list[str] = []) -> None:
+        # files a stage updates in place (reads and writes) are in both inputs and outputs
+        self.name = name
+        self.script = script
+        self.cwd = cwd
+        self.inputs = inputs
+        self.outputs = outputs
+        self.args = args
+
+    def with_delta(self) -> "Stage":
+        # the stage as run with --delta
+        return Stage(self.name, self.script, self.cwd, self.inputs, self.outputs, self.args + ["--delta"])
+
+    def command(self, extra_args: list[str] = []) -> list[str]:
+        return [sys.executable, str(ROOT / self.script)] + self.args + extra_args
+
+    def files(self, files: list[str | File], extra_args: list[str] = [], optional: bool | None = None) -> list[str]:
+        """
+        The paths of files (relative to ROOT) for the arguments the script runs with, only the (non-)optional ones if optional is given.
+        """
+        paths = []
+        for file in files:
+            file = File(file) if isinstance(file, str) else file
+            path = file.resolve(self.args + extra_args, self.cwd)
+            if path is not None and path not in paths and (optional is None or file.optional == optional):
+                paths.append(path)
+        return paths
+
+
+STAGES = [
+    Stage(
+        "extract", "code/extract_keywords.py", ".",
+        inputs=[
+            File("datasets/project.csv", ["--projectfile", "-pf"]), File("datasets/euroscivoc.csv", ["--euroscivocfile", "-ef"]),
+            File("datasets/cordis-HORIZONprojects-xml.zip", ["--export-file"], when=["--source=export"]),
+            File("out/extracted.csv", ["--outfile", "-of"], when=["--delta", "--checkpoint", "--stream"], optional=True),  # merged into or resumed from
+            File("out/delta_state.csv", ["--delta-state"], when=["--delta"], optional=True),
+            File("out/euroscivoc_index.sqlite", ["--euroscivoc-index"], when=["--stream"], optional=True),
+            "code/extract_keywords.py", "code/cordis_export.py", "code/euroscivoc_index.py", "code/metrics.py", "code/page_cache.py", "code/tables.py",
+        ],
+        outputs=[
+            File("out/extracted.csv", ["--outfile", "-of"]),
+            File("out/delta_ids.csv", ["--delta-ids"], when=["--delta"]), File("out/delta_state.csv", ["--delta-state"], when=["--delta"]),
+            File("out/euroscivoc_index.sqlite", ["--euroscivoc-index"], when=["--stream"]),
+        ],
+    ),
+    Stage(
+        "count", "code/get_most_occurring_keywords.py", ".",
+        inputs=[File("out/extracted.csv", ["--extractedfile", "-ef"]), "code/get_most_occurring_keywords.py", "code/metrics.py", "code/normalize.py", "code/tables.py", "code/vocabulary.py"],
+        outputs=["out/kw_counts.csv", "out/kw_ecmax.csv"],
+    ),
+    Stage(
+        "map", "categorization/get_keyword_mappings.py", "categorization",
+        inputs=[
+            File("out/extracted.csv", ["--extractedfile", "-ef"]), "categorization/categories.json", "categorization/subcategories.json", "categorization/subsubcategories.json",
+            File("categorization/ignore_kws.txt", optional=True),
+            File("categorization/kw_categorizations.csv", when=["--incremental", "-i", "--delta", "-d"], optional=True),  # updated in place
+            File("categorization/kw_categorizations_state.json", when=["--incremental", "-i", "--delta", "-d"], optional=True),
+            File("categorization/similarity_cache.pkl", optional=True), File("categorization/categorizer_snapshot.pkl", optional=True),
+            "categorization/get_keyword_mappings.py", "categorization/categorizer.py", "categorization/similarity.py",
+            "code/metrics.py", "code/normalize.py", "code/tables.py", "code/vocabulary.py",
+        ],
+        outputs=[
+            "categorization/kw_categorizations.csv", "categorization/kw_categorizations_state.json",
+            "categorization/similarity_cache.pkl", "categorization/categorizer_snapshot.pkl",
+        ],
+    ),
+    Stage(
+        "categorize", "categorization/categorize.py", "categorization",
+        inputs=[
+            File("out/extracted.csv", ["--extractedfile", "-ef"]), "categorization/kw_categorizations.csv",
+            File("out/delta_ids.csv", ["--delta", "-d"], when=["--delta", "-d"]),
+            File("out/categorized.csv", ["--outfile", "-of"], when=["--delta", "-d"], optional=True),  # categories of the unchanged projects
+            "categorization/categorize.py", "code/metrics.py", "code/normalize.py", "code/tables.py", "code/vocabulary.py",
+        ],
+        outputs=[File("out/categorized.csv", ["--outfile", "-of"])],
+    ),
+    Stage(
+        "table", "code/gen_table.py", "code",
+        inputs=[
+            File("out/categorized.csv", ["--categorizedfile", "-cf"]), File("categorization/categories.json", ["--categoriesfile"]),
+            File("categorization/subcategories.json", ["--subcategoriesfile"]), File("categorization/subsubcategories.json", ["--subsubcategoriesfile"]),
+            "code/gen_table.py", "code/metrics.py", "code/tables.py",
+        ],
+        outputs=[File("overviewCategories.csv", ["--outfile", "-of"])],
+        args=["--outfile", "../overviewCategories.csv"],
+    ),
+]
+DELTA_STAGES = ["extract", "map", "categorize"]  # stages with a --delta option, see --delta
+
+
+def file_hash(path: Path) -> str | None:
+    if not path.exists():
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_dependencies(stages: list[Stage], stage_args: dict[str, list[str]] = {}) -> dict[str, set[str]]:
+    # a stage depends on the (other) stages that write one of its inputs
+    producers = {output: stage.name for stage in stages for output in stage.files(stage.outputs, stage_args.get(stage.name, []))}
+    return {
+        stage.name: {producers[path] for path in stage.files(stage.inputs, stage_args.get(stage.name, [])) if producers.get(path, stage.name) != stage.name}
+        for stage in stages
+    }
+
+
+def select_stages(names: list[str], dependencies: dict[str, set[str]]) -> set[str]:
+    # the given stages and everything upstream of them
+    selected = set()
+    todo = list(names)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(dependencies[name])
+    return selected
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage], state_file: Path = STATE_FILE, stage_args: dict[str, list[str]] = {}) -> None:
+        self.stages = {stage.name: stage for stage in stages}
+        self.dependencies = get_dependencies(stages, stage_args)
+        self.state_file = state_file
+        self.stage_args = stage_args
+        self.run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.timings = {}  # {stage name: status and time of the stage in this run}
+        self.state = {}
+        if state_file.exists():
+            with open(state_file, "r") as f:
+                self.state = json.load(f)
+
+    def inputs(self, stage: Stage, optional: bool | None = None) -> list[str]:
+        # the files the stage reads that it doesn't write, those it updates in place are checked with its outputs
+        outputs = self.outputs(stage)
+        return [path for path in stage.files(stage.inputs, self.stage_args.get(stage.name, []), optional) if path not in outputs]
+
+    def outputs(self, stage: Stage) -> list[str]:
+        return stage.files(stage.outputs, self.stage_args.get(stage.name, []))
+
+    def fingerprint(self, stage: Stage) -> dict:
+        return {
+            "args": stage.args + self.stage_args.get(stage.name, []),
+            "inputs": {path: file_hash(ROOT / path) for path in self.inputs(stage)},
+        }
+
+    def is_up_to_date(self, stage: Stage) -> bool:
+        recorded = self.state.get(stage.name)
+        if recorded is None or recorded["fingerprint"] != self.fingerprint(stage):
+            return False
+        # outputs that were removed or changed since the stage ran have to be made again
+        return all(file_hash(ROOT / path) == recorded["outputs"].get(path) for path in self.outputs(stage))
+
+    def run_stage(self, stage: Stage) -> dict | None:
+        """
+        Run the script of the stage, returns the state to record or None if it failed.
+        """
+        fingerprint = self.fingerprint(stage)
+        missing = [path for path in self.inputs(stage, optional=False) if fingerprint["inputs"][path] is None]
+        if len(missing) > 0:
+            print(f"[{stage.name}] missing inputs: {', '.join(missing)}")
+            self.timings[stage.name] = {"status": "missing inputs"}
+            return None
+
+        command = stage.command(self.stage_args.get(stage.name, []))
+        print(f"[{stage.name}] running {shlex.join(command[1:])} (in {stage.cwd})")
+        start = time.time()
+        result = subprocess.run(command, cwd=ROOT / stage.cwd, env={**os.environ, RUN_ID_ENV: self.run_id})
+        seconds = time.time() - start
+        report_file = METRICS_DIR / f"{self.run_id}-{Path(stage.script).stem}.json"
+        self.timings[stage.name] = {
+            "status": "done" if result.returncode == 0 else "failed",
+            "wall_seconds": seconds,
+            "metrics": str(report_file.relative_to(ROOT)) if report_file.exists() else None,
+        }
+        if result.returncode != 0:
+            print(f"[{stage.name}] failed with exit code {result.returncode}")
+            return None
+
+        print(f"[{stage.name}] done in {seconds:.1f}s")
+        return {
+            "fingerprint": fingerprint,
+            "outputs": {path: file_hash(ROOT / path) for path in self.outputs(stage)},
+        }
+
+    def save_state(self) -> None:
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_file, "w") as f:
+            json.dump(self.state, f, indent=2)
+
+    def save_metrics(self, wall_seconds: float) -> None:
+        out_file = METRICS_DIR / f"{self.run_id}-pipeline.json"
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(out_file, "w") as f:
+            json.dump({"run": self.run_id, "argv": sys.argv, "wall_seconds": wall_seconds, "stages": self.timings}, f, indent=2)
+        print(f"Metrics written to {out_file}")
+
+    def run(self, names: list[str], force: bool = False, jobs: int = 1, dry_run: bool = False) -> bool:
+        """
+        Run the given stages and the stages they depend on, as soon as their dependencies are done.
+        Returns whether all of them succeeded (or were up to date).
+        """
+        todo = select_stages(names, self.dependencies)
+        done, failed = set(), set()
+        would_run = set()  # for dry runs, everything downstream of these would run as well
+        running = {}  # {future: stage name}
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            while todo or running:
+                for name in sorted(todo):
+                    dependencies = self.dependencies[name] & (todo | done | failed | set(running.values()))
+                    if dependencies & failed:
+                        print(f"[{name}] skipped, an upstream stage failed")
+                        self.timings[name] = {"status": "skipped"}
+                        todo.remove(name)
+                        failed.add(name)
+                    elif dependencies <= done:
+                        todo.remove(name)
+                        stage = self.stages[name]
+                        if not force and not (dependencies & would_run) and self.is_up_to_date(stage):
+                            print(f"[{name}] up to date")
+                            self.timings[name] = {"status": "up to date"}
+                            done.add(name)
+                        elif dry_run:
+                            print(f"[{name}] would run {shlex.join(stage.command(self.stage_args.get(name, []))[1:])} (in {stage.cwd})")
+                            would_run.add(name)
+                            done.add(name)
+                        else:
+                            running[executor.submit(self.run_stage, stage)] = name
+
+                if len(running) == 0:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    stage_state = future.result()
+                    if stage_state is None:
+                        failed.add(name)
+                        continue
+                    self.state[name] = stage_state
+                    self.save_state()
+                    done.add(name)
+        if not dry_run:
+            self.save_metrics(time.time() - start)
+        return len(failed) == 0
+
+
+if __name__ == "__main__":
+    stage_names = [stage.name for stage in STAGES]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("stages", nargs="*", help=f"stages to run, with the stages they depend on: {', '.join(stage_names)} (default: all)")
+    parser.add_argument("--force", "-f", action="store_true", help="run the stages even if they are up to date")
+    parser.add_argument("--jobs", "-j", default=2, type=int, help="number of stages to run at the same time")
+    parser.add_argument("--dry-run", "-n", action="store_true", help="only show which stages would run")
+    parser.add_argument("--delta", "-d", action="store_true", help=f"run {', '.join(DELTA_STAGES)} with --delta: only the projects that are new or updated in the project file")
+    parser.add_argument("--args", "-a", action="append", default=[], metavar="STAGE=ARGS", help="extra arguments for the script of a stage")
+    args = parser.parse_args()
+
+    for name in args.stages:
+        if name not in stage_names:
+            parser.error(f"unknown stage {name}, choose from {', '.join(stage_names)}")
+
+    stage_args = {}
+    for stage_arg in args.args:
+        name, _, extra_args = stage_arg.partition("=")
+        if name not in stage_names:
+            parser.error(f"unknown stage {name} in --args {stage_arg}")
+        stage_args[name] = shlex.split(extra_args)
+    stages = [stage.with_delta() if args.delta and stage.name in DELTA_STAGES else stage for stage in STAGES]
+
+    pipeline = Pipeline(stages, stage_args=stage_args)
+    sys.exit(0 if pipeline.run(args.stages or stage_names, args.force, args.jobs, args.dry_run) else 1)